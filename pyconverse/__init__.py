@@ -4,3 +4,11 @@ from .speaker_stats import SpeakerStats
 from .zeroshot_topic_model import ZeroShotTopicFinder
 from .segmentation import SemanticTextSegmentation
 from .summarization import TranscriptSummarization
+from .utils import warmup, set_inference_backend
+from .registry import model_registry
+from .corpus import CorpusAnalyzer
+from .doc_store import DocStore
+from .embedding_cache import default_embedding_cache, EmbeddingCache
+from .streaming import StreamingCallyzer
+from .backchannel import BackchannelMatcher
+from .hypernym_index import default_hypernym_index, HypernymIndex
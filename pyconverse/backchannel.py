@@ -0,0 +1,72 @@
+import attr
+import pandas as pd
+from ._const import backchannel as constants
+from .utils import remove_punct, punct_pattern, spaces_pattern
+
+
+@attr.s
+class BackchannelMatcher:
+
+    """
+    Dictionary based backchannel detection.
+
+    An utterance is a backchannel when it, its lowercase form, or the same two forms with
+    punctuation removed, is one of the lexicon phrases. The lexicon is held in a frozenset
+    and a whole column is normalized at once with pandas `.str` operations.
+
+    Paramters
+    ---------
+    lexicon: list
+        backchannel phrases, defaults to the built-in list of common backchannels.
+
+    extra: list
+        phrases added to the lexicon, e.g. domain specific acknowledgements.
+
+    Example
+    -------
+    >>> matcher = BackchannelMatcher(extra=['noted', 'got it'])
+    >>> matcher.match(data['utterance'])
+    """
+
+    lexicon = attr.ib(default=None)
+    extra = attr.ib(factory=list)
+    _phrases = attr.ib(default=None, init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        lexicon = constants if self.lexicon is None else self.lexicon
+        self._phrases = frozenset(list(lexicon) + list(self.extra))
+
+    def match(self, texts):
+        """
+        Tag every text as backchannel or not.
+
+        Parameters
+        ----------
+        texts: pd.Series or list
+            texts to tag.
+
+        Returns
+        -------
+        backchannel: pd.Series
+            boolean series aligned with texts.
+        """
+        if not isinstance(texts, pd.Series):
+            texts = pd.Series(texts, dtype=object)
+
+        clean_texts = texts.str.replace(punct_pattern, ' ', regex=True).str.replace(
+            spaces_pattern, ' ', regex=True)
+        phrases = self._phrases
+        return (texts.isin(phrases) | texts.str.lower().isin(phrases) |
+                clean_texts.isin(phrases) | clean_texts.str.lower().isin(phrases))
+
+    def is_backchannel(self, text):
+        """
+        Returns True if the text is a backchannel.
+        """
+        clean_text = remove_punct(text)
+        phrases = self._phrases
+        return (text in phrases or text.lower() in phrases or
+                clean_text in phrases or clean_text.lower() in phrases)
+
+
+default_matcher = BackchannelMatcher()
@@ -0,0 +1,137 @@
+import asyncio
+import attr
+
+
+@attr.s
+class MicroBatcher:
+
+    """
+    Micro-batching scheduler for asyncio services.
+
+    Items submitted by concurrent coroutines are queued and flushed together, when
+    `max_batch_size` items are waiting or `max_wait` seconds after the first one arrived.
+    Every batch is run by `fn` in a worker thread, so the event loop is never blocked,
+    and each caller gets back the results of its own items. When `fn` raises (or does not
+    return one result per item) the items of the batch are run again one by one, so only
+    the callers of the failing items get the error.
+
+    Paramters
+    ---------
+    fn: callable
+        function taking a list of items and returning the list of their results.
+
+    max_batch_size: int
+        maximum number of items per call of `fn`.
+
+    max_wait: float
+        maximum seconds an item waits for the batch to fill up.
+
+    executor: concurrent.futures.Executor
+        executor running `fn`, the event loop default executor if None.
+    """
+
+    fn = attr.ib()
+    max_batch_size = attr.ib(default=32)
+    max_wait = attr.ib(default=0.01)
+    executor = attr.ib(default=None)
+    _loop = attr.ib(default=None, init=False, repr=False)
+    _queue = attr.ib(default=None, init=False, repr=False)
+    _worker = attr.ib(default=None, init=False, repr=False)
+
+    async def submit(self, items):
+        """
+        Queue the items and wait for their results.
+
+        Parameters
+        ----------
+        items: list
+            list of items to process.
+
+        Returns
+        -------
+        results: list
+            results of `fn` for the items, in the same order.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+        futures = []
+        for item in items:
+            future = loop.create_future()
+            self._queue.put_nowait((item, future))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                deadline = loop.time() + self.max_wait
+                while len(batch) < self.max_batch_size:
+                    if not self._queue.empty():
+                        batch.append(self._queue.get_nowait())
+                        continue
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+                try:
+                    results = await self._call(loop, [i for i, _ in batch])
+                except Exception as e:
+                    if len(batch) == 1:
+                        self._set(batch[0][1], exception=e)
+                        continue
+                    # run the items one by one, so only the failing ones get the error
+                    for item, future in batch:
+                        try:
+                            result = (await self._call(loop, [item]))[0]
+                        except Exception as e:
+                            self._set(future, exception=e)
+                        else:
+                            self._set(future, result)
+                    continue
+
+                for (_, future), result in zip(batch, results):
+                    self._set(future, result)
+        except asyncio.CancelledError:
+            self._fail([future for _, future in batch])
+            raise
+
+    async def _call(self, loop, items):
+        results = await loop.run_in_executor(self.executor, self.fn, items)
+        results = list(results)
+        if len(results) != len(items):
+            raise ValueError("`fn` returned {} results for {} items".format(len(results), len(items)))
+        return results
+
+    def _set(self, future, result=None, exception=None):
+        # the caller may have been cancelled meanwhile
+        if future.done():
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def _fail(self, futures):
+        for future in futures:
+            self._set(future, exception=RuntimeError("MicroBatcher was closed"))
+
+    def close(self):
+        """
+        Stop the background worker. The items still waiting get a RuntimeError.
+        """
+        if self._worker is not None:
+            self._worker.cancel()
+        if self._queue is not None:
+            while not self._queue.empty():
+                self._fail([self._queue.get_nowait()[1]])
@@ -0,0 +1,403 @@
+import numpy as np
+from .utils import load_zeroshot_model
+from .embedding_cache import default_embedding_cache
+
+
+def _entailment_id(classifier):
+    for label, index in classifier.model.config.label2id.items():
+        if label.lower().startswith("entail"):
+            return index
+    return -1
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def _pair_inputs(tokenizer, premises, hypotheses):
+    # Mirrors tokenizer(premise, hypothesis, truncation='only_first') on
+    # already tokenized ids, so every text and label is tokenized only once.
+    max_length = tokenizer.model_max_length
+    n_special = tokenizer.num_special_tokens_to_add(pair=True)
+    use_token_types = 'token_type_ids' in tokenizer.model_input_names
+
+    features = []
+    for premise, hypothesis in zip(premises, hypotheses):
+        premise = premise[:max(max_length - n_special - len(hypothesis), 0)]
+        feature = {'input_ids': tokenizer.build_inputs_with_special_tokens(
+            premise, hypothesis)}
+        if use_token_types:
+            feature['token_type_ids'] = tokenizer.create_token_type_ids_from_sequences(
+                premise, hypothesis)
+        features.append(feature)
+    return tokenizer.pad(features, padding=True, return_tensors='pt')
+
+
+def _entailment_logits(classifier, texts, hypotheses, text_idx, hypothesis_idx, batch_size=32):
+    # Entailment logit of every (texts[text_idx[i]], hypotheses[hypothesis_idx[i]]) pair.
+    # Pairs are sorted by token length and run through the NLI model in padded batches.
+    import torch
+
+    tokenizer, model = classifier.tokenizer, classifier.model
+    entailment_id = _entailment_id(classifier)
+    logits = np.zeros(len(text_idx), dtype=np.float32)
+    if not len(text_idx):
+        return logits
+
+    text_ids = tokenizer(list(texts), add_special_tokens=False)['input_ids']
+    hypothesis_ids = tokenizer(list(hypotheses), add_special_tokens=False)['input_ids']
+    text_len = np.array([len(i) for i in text_ids])
+    hypothesis_len = np.array([len(i) for i in hypothesis_ids])
+    order = np.argsort(text_len[text_idx] + hypothesis_len[hypothesis_idx], kind='stable')
+
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        inputs = _pair_inputs(tokenizer,
+                              [text_ids[i] for i in text_idx[batch]],
+                              [hypothesis_ids[i] for i in hypothesis_idx[batch]])
+        inputs = {k: v.to(classifier.device) for k, v in inputs.items()}
+        with torch.no_grad():
+            outputs = model(**inputs)[0]
+        logits[batch] = outputs[:, entailment_id].float().cpu().numpy()
+    return logits
+
+
+def zeroshot_label_set_scores(texts, label_sets, batch_size=32,
+                              hypothesis_template="This example is {}.", classifier=None):
+    """
+    Score texts against several candidate label sets in one batched pass.
+
+    Each text and each distinct hypothesis is tokenized once, and hypotheses shared
+    between label sets are scored once. The (text, hypothesis) pairs of all label sets
+    are sorted by token length and run through the NLI model in padded batches of
+    `batch_size`, so a batch holds pairs of similar length.
+
+    Parameters
+    ----------
+    texts: list
+        list of texts to classify.
+
+    label_sets: dict
+        mapping of label set name to its list of candidate labels.
+
+    batch_size: int
+        number of (text, hypothesis) pairs per forward pass.
+
+    hypothesis_template: str
+        template used to turn each label into an NLI hypothesis.
+
+    classifier: transformers.Pipeline
+        zero-shot pipeline to use, the shared bart-large-mnli model by default.
+
+    Returns
+    -------
+    scores: dict
+        mapping of label set name to an array of shape (len(texts), len(labels)).
+        Every row sums to 1, same as the zero-shot-classification pipeline.
+    """
+    if isinstance(texts, str):
+        texts = [texts]
+
+    classifier = classifier or load_zeroshot_model()
+    hypotheses = {}
+    for labels in label_sets.values():
+        for label in labels:
+            hypotheses.setdefault(hypothesis_template.format(label), len(hypotheses))
+
+    n_texts, n_hypotheses = len(texts), len(hypotheses)
+    text_idx = np.repeat(np.arange(n_texts), n_hypotheses)
+    hypothesis_idx = np.tile(np.arange(n_hypotheses), n_texts)
+    logits = _entailment_logits(classifier, texts, list(hypotheses), text_idx, hypothesis_idx, batch_size)
+
+    logits = logits.reshape(n_texts, n_hypotheses)
+    scores = {}
+    for name, labels in label_sets.items():
+        columns = [hypotheses[hypothesis_template.format(i)] for i in labels]
+        scores[name] = _softmax(logits[:, columns]) if columns else logits[:, columns]
+    return scores
+
+
+def zeroshot_scores(texts, candidate_labels, batch_size=32,
+                    hypothesis_template="This example is {}.", classifier=None):
+    """
+    Batched equivalent of the zero-shot-classification pipeline (single label mode).
+
+    Parameters
+    ----------
+    texts: list
+        list of texts to classify.
+
+    candidate_labels: list
+        list of labels.
+
+    batch_size: int
+        number of (text, hypothesis) pairs per forward pass.
+
+    hypothesis_template: str
+        template used to turn each label into an NLI hypothesis.
+
+    classifier: transformers.Pipeline
+        zero-shot pipeline to use, the shared bart-large-mnli model by default.
+
+    Returns
+    -------
+    scores: np.ndarray
+        array of shape (len(texts), len(candidate_labels)), every row sums to 1.
+    """
+    return zeroshot_label_set_scores(texts, {'labels': candidate_labels}, batch_size,
+                                     hypothesis_template, classifier)['labels']
+
+
+def zeroshot_text_label_scores(texts, label_lists, batch_size=32,
+                               hypothesis_template="This example is {}.", classifier=None):
+    """
+    Score every text against its own list of candidate labels in one batched pass.
+
+    The distinct hypotheses of all the label lists are tokenized once, and only the
+    (text, label) pairs of each text are run through the NLI model.
+
+    Parameters
+    ----------
+    texts: list
+        list of texts to classify.
+
+    label_lists: list
+        list of candidate labels of every text.
+
+    batch_size: int
+        number of (text, hypothesis) pairs per forward pass.
+
+    hypothesis_template: str
+        template used to turn each label into an NLI hypothesis.
+
+    classifier: transformers.Pipeline
+        zero-shot pipeline to use, the shared bart-large-mnli model by default.
+
+    Returns
+    -------
+    scores: list
+        array of scores of every text, of the length of its label list and summing to 1.
+    """
+    if isinstance(texts, str):
+        texts = [texts]
+
+    classifier = classifier or load_zeroshot_model()
+    hypotheses, text_idx, hypothesis_idx = {}, [], []
+    for index, labels in enumerate(label_lists):
+        for label in labels:
+            text_idx.append(index)
+            hypothesis_idx.append(hypotheses.setdefault(hypothesis_template.format(label), len(hypotheses)))
+
+    logits = _entailment_logits(classifier, texts, list(hypotheses), np.array(text_idx, dtype=int),
+                                np.array(hypothesis_idx, dtype=int), batch_size)
+    bounds = np.cumsum([0] + [len(i) for i in label_lists])
+    return [_softmax(logits[start:end]) if end > start else logits[start:end]
+            for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def _cosine(texts, hypotheses, model_name, batch_size):
+    text_vectors = default_embedding_cache.encode(texts, model_name, batch_size).astype(np.float64)
+    label_vectors = default_embedding_cache.encode(hypotheses, model_name, batch_size).astype(np.float64)
+    text_vectors /= np.maximum(np.linalg.norm(text_vectors, axis=1, keepdims=True), 1e-12)
+    label_vectors /= np.maximum(np.linalg.norm(label_vectors, axis=1, keepdims=True), 1e-12)
+    return text_vectors @ label_vectors.T
+
+
+def embedding_label_set_scores(texts, label_sets, batch_size=32, hypothesis_template="This example is {}.",
+                               model_name='all-MiniLM-L6-v2', temperature=0.05):
+    """
+    Fast alternative to `zeroshot_label_set_scores` using a sentence-transformer bi-encoder.
+
+    The texts and the label descriptions are encoded once (through the embedding cache) and
+    the cosine similarities of every label set are turned into scores with a softmax at
+    `temperature`, so the rows sum to 1. These scores are not on the scale of the NLI ones,
+    use `label_threshold(labels, 'embedding')` with `top_labels`, see `calibrate_embedding_thresholds`.
+
+    Parameters
+    ----------
+    texts: list
+        list of texts to classify.
+
+    label_sets: dict
+        mapping of label set name to its list of candidate labels.
+
+    batch_size: int
+        number of texts encoded per forward pass.
+
+    hypothesis_template: str
+        template used to turn each label into its description.
+
+    model_name: str
+        sentence transformer model name.
+
+    temperature: float
+        softmax temperature applied to the cosine similarities, lower is more confident.
+
+    Returns
+    -------
+    scores: dict
+        mapping of label set name to an array of shape (len(texts), len(labels)).
+    """
+    if isinstance(texts, str):
+        texts = [texts]
+
+    hypotheses = {}
+    for labels in label_sets.values():
+        for label in labels:
+            hypotheses.setdefault(hypothesis_template.format(label), len(hypotheses))
+
+    similarities = _cosine(list(texts), list(hypotheses), model_name, batch_size)
+    scores = {}
+    for name, labels in label_sets.items():
+        columns = [hypotheses[hypothesis_template.format(i)] for i in labels]
+        scores[name] = _softmax(similarities[:, columns] / temperature) if columns else similarities[:, columns]
+    return scores
+
+
+def embedding_text_label_scores(texts, label_lists, batch_size=32, hypothesis_template="This example is {}.",
+                                model_name='all-MiniLM-L6-v2', temperature=0.05):
+    """
+    Fast alternative to `zeroshot_text_label_scores`, see `embedding_label_set_scores`.
+    """
+    if isinstance(texts, str):
+        texts = [texts]
+
+    hypotheses = {}
+    for labels in label_lists:
+        for label in labels:
+            hypotheses.setdefault(hypothesis_template.format(label), len(hypotheses))
+
+    similarities = _cosine(list(texts), list(hypotheses), model_name, batch_size)
+    scores = []
+    for index, labels in enumerate(label_lists):
+        columns = [hypotheses[hypothesis_template.format(i)] for i in labels]
+        scores.append(_softmax(similarities[index, columns] / temperature) if columns
+                      else similarities[index, columns])
+    return scores
+
+
+_label_set_backends = {'nli': zeroshot_label_set_scores, 'embedding': embedding_label_set_scores}
+
+_text_label_backends = {'nli': zeroshot_text_label_scores, 'embedding': embedding_text_label_scores}
+
+
+def _backend(backends, backend):
+    if backend not in backends:
+        raise ValueError("Please pass backend either as `nli` or `embedding`")
+    return backends[backend]
+
+
+def label_set_scores(texts, label_sets, batch_size=32, backend='nli'):
+    """
+    Score texts against several candidate label sets with the chosen backend.
+
+    `nli` runs the bart-large-mnli cross-encoder on every (text, label) pair, see
+    `zeroshot_label_set_scores`. `embedding` compares sentence-transformer embeddings,
+    see `embedding_label_set_scores`: much cheaper, a little less accurate.
+    """
+    return _backend(_label_set_backends, backend)(texts, label_sets, batch_size)
+
+
+def text_label_scores(texts, label_lists, batch_size=32, backend='nli'):
+    """
+    Score every text against its own candidate labels with the chosen backend, see `label_set_scores`.
+    """
+    return _backend(_text_label_backends, backend)(texts, label_lists, batch_size)
+
+
+nli_threshold = 0.45
+
+# top score threshold of the embedding backend per label set (tuple of labels), the defaults
+# of the built-in label sets are set in `insights`, `calibrate_embedding_thresholds` adds others
+embedding_thresholds = {}
+
+
+def margin_threshold(n_labels, margin=0.05, temperature=0.05):
+    """
+    Returns the top embedding score of a row whose best label is `margin` (cosine) above all the others.
+
+    With scores softmax(cosine / temperature), a best label one temperature above the others is
+    e times as likely as each of them. Used for the label sets without a calibrated threshold.
+    """
+    return 1.0 / (1.0 + (n_labels - 1) * np.exp(-margin / temperature)) if n_labels else 0.0
+
+
+def label_threshold(candidate_labels, backend='nli'):
+    """
+    Returns the `top_labels` threshold of a label set for the backend.
+
+    The NLI scores use the fixed 0.45 threshold. The embedding scores use the threshold of the
+    label set in `embedding_thresholds`, defaults ship for the emotion and empathy labels and
+    `calibrate_embedding_thresholds` fits others. Without one, `margin_threshold` is used.
+    """
+    if backend == 'nli':
+        return nli_threshold
+    _backend(_label_set_backends, backend)
+    labels = tuple(candidate_labels)
+    threshold = embedding_thresholds.get(labels)
+    return margin_threshold(len(labels)) if threshold is None else threshold
+
+
+def calibrate_embedding_thresholds(texts, label_sets, batch_size=32):
+    """
+    Calibrate the embedding backend thresholds against the NLI backend.
+
+    The texts are tagged with both backends. For every label set, the threshold on the
+    embedding top score is the one whose labels agree the most with the NLI labels
+    (including "not found"), the lowest one on ties. The thresholds are stored in
+    `embedding_thresholds` and used by every later embedding tagging of these label sets.
+
+    Parameters
+    ----------
+    texts: list
+        sample of texts representative of the ones to tag, a few hundred utterances are enough.
+
+    label_sets: dict
+        mapping of label set name to its list of candidate labels.
+
+    batch_size: int
+        number of (text, label) pairs per NLI forward pass.
+
+    Returns
+    -------
+    calibration: dict
+        mapping of label set name to (threshold, agreement with the NLI labels).
+
+    Example
+    -------
+    >>> calibrate_embedding_thresholds(data['utterance'].sample(500), {'emotion': emotion_labels})
+    {'emotion': (0.31..., 0.62...)}
+    """
+    nli_scores = zeroshot_label_set_scores(texts, label_sets, batch_size)
+    embedding_scores = embedding_label_set_scores(texts, label_sets, batch_size)
+
+    calibration = {}
+    for name, labels in label_sets.items():
+        reference = np.array(top_labels(nli_scores[name], labels), dtype=object)
+        scores = embedding_scores[name]
+        best = np.array(labels, dtype=object)[scores.argmax(axis=1)]
+        top = scores.max(axis=1)
+
+        candidates = np.unique(np.concatenate([[0.0], top]))
+        found = top[None, :] >= candidates[:, None]
+        agreement = np.where(found, best == reference, reference == "not found").mean(axis=1)
+        index = int(agreement.argmax())
+
+        embedding_thresholds[tuple(labels)] = float(candidates[index])
+        calibration[name] = (float(candidates[index]), float(agreement[index]))
+    return calibration
+
+
+def top_labels(scores, candidate_labels, threshold=nli_threshold):
+    """
+    Returns the best label of every row of `scores`, or "not found" when its score is below `threshold`.
+    """
+    return_data = []
+    for idx, label in enumerate(scores.argmax(axis=1)):
+        if scores[idx, label] >= threshold:
+            return_data.append(candidate_labels[label])
+        else:
+            return_data.append("not found")
+    return return_data
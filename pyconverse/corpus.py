@@ -0,0 +1,286 @@
+import attr
+import numpy as np
+import pandas as pd
+from collections import Counter
+from .insights import Callyzer, emotion_labels, empathy_labels
+from .speaker_stats import SpeakerStats
+from .segmentation import SemanticTextSegmentation
+from .summarization import TranscriptSummarization
+from .doc_store import DocStore
+from .utils import load_summarization_model
+
+
+@attr.s
+class CorpusAnalyzer:
+
+    """
+    Analyse many call transcripts in one invocation.
+
+    Utterances of all the calls are flattened into one frame, so the model backed
+    features (emotion, empathy, backchannel, questions) are computed in shared batches
+    across calls instead of being re-batched for every call, one chunk of utterances at a time.
+    The segments of all the calls are summarized in shared batches too. Every feature is returned
+    as one tidy table with a `call_id` and an `utterance_idx` (position of the utterance
+    within its call) column.
+
+    Paramters
+    ---------
+    data: pd.Dataframe or iterable of pd.Dataframe
+        Pass the transcripts in long format, one row per utterance, with a column holding the call id.
+
+    call_id: str
+        pass the column name which represent call id in transcript dataframe
+
+    speaker: str
+        pass the column name which represent speaker name/id in transcript dataframe
+
+    utterance: str
+        pass the column name which represent utterance in transcript dataframe
+
+    startime: str
+        pass the column name which represent start time for utterance in transcript dataframe
+
+    endtime: str
+         pass the column name which represent end time for utterance in transcript dataframe
+
+    doc_store: DocStore
+        store of parsed spacy documents shared by all the features. By default a store keeping
+        the `max_docs` most recently used documents, pass an unbounded `DocStore()` to parse
+        every utterance only once when the corpus fits in memory.
+
+    max_docs: int
+        size of the default document store.
+
+    chunk_size: int
+        number of utterances analysed at a time by the utterance level features, so only the
+        documents, tokens and model scores of one chunk are held at once.
+    """
+
+    data = attr.ib()
+    call_id = attr.ib(default='call_id')
+    utterance = attr.ib(default='utterance')
+    speaker = attr.ib(default='speaker')
+    starttime = attr.ib(default='startTime')
+    endtime = attr.ib(default='endTime')
+    doc_store = attr.ib(default=None)
+    max_docs = attr.ib(default=10000)
+    chunk_size = attr.ib(default=10000)
+
+    def __attrs_post_init__(self):
+        if self.doc_store is None:
+            self.doc_store = DocStore(max_size=self.max_docs)
+
+        if not isinstance(self.data, pd.DataFrame):
+            self.data = pd.concat(list(self.data), ignore_index=True)
+
+        columns = self.data.columns.tolist()
+        if self.call_id not in columns:
+            raise ValueError("Please pass proper call_id column")
+
+        if self.utterance not in columns:
+            raise ValueError("Please pass proper utterance column")
+
+        # keep the utterances of a call contiguous, calls in order of first appearance
+        codes, _ = pd.factorize(self.data[self.call_id])
+        order = np.argsort(codes, kind='stable')
+        self.data = self.data.iloc[order].reset_index(drop=True)
+        self._codes = codes[order]
+
+    def _frame(self, **columns):
+        frame = pd.DataFrame({self.call_id: self.data[self.call_id],
+                              'utterance_idx': self.data.groupby(self.call_id, sort=False).cumcount()})
+        for name, values in columns.items():
+            frame[name] = np.asarray(values)
+        return frame
+
+    def _chunks(self):
+        for start in range(0, len(self.data), self.chunk_size):
+            yield self.data.iloc[start:start + self.chunk_size]
+
+    def _callyzer(self, data=None):
+        return Callyzer(self.data if data is None else data, self.utterance, self.speaker,
+                        self.starttime, self.endtime, self.doc_store)
+
+    def tag_labels(self, label_sets=None, batch_size=32, backend='nli'):
+        """
+        Tag every utterance of the corpus against several candidate label sets in shared batches.
+
+        Parameters
+        ----------
+        label_sets: dict
+           mapping of column name to its candidate labels.
+           defaults to {'emotion': emotion labels, 'is_empathy': empathy labels}.
+
+        batch_size: int
+           number of (utterance, label) pairs scored per model forward pass.
+
+        backend: str, nli or embedding
+           labeling backend, see `Callyzer.tag_emotion`.
+
+        Returns
+        -------
+        labels: pd.DataFrame
+            one row per utterance with a column per label set.
+        """
+        classes = [self._callyzer(chunk).tag_labels(label_sets, inplace=False, batch_size=batch_size,
+                                                    backend=backend)
+                   for chunk in self._chunks()]
+        if not classes:
+            return self._frame(**{k: [] for k in label_sets or ('emotion', 'is_empathy')})
+        classes = pd.concat(classes)
+        return self._frame(**{k: classes[k] for k in classes.columns})
+
+    def tag_emotion(self, batch_size=32, backend='nli'):
+        """
+        Tag the emotion of every utterance in the corpus. See `Callyzer.tag_emotion`.
+        """
+        return self.tag_labels({'emotion': emotion_labels}, batch_size, backend)
+
+    def tag_empathy(self, batch_size=32, backend='nli'):
+        """
+        Tag if every utterance in the corpus is empathetic or not. See `Callyzer.tag_empathy`.
+        """
+        return self.tag_labels({'is_empathy': empathy_labels}, batch_size, backend)
+
+    def tag_questions(self, n_process=1, batch_size=256):
+        """
+        Tag if every utterance in the corpus is a question or not. See `Callyzer.tag_questions`.
+        """
+        questions = [self._callyzer(chunk).tag_questions(inplace=False, n_process=n_process,
+                                                         batch_size=batch_size)
+                     for chunk in self._chunks()]
+        return self._frame(is_question=pd.concat(questions) if questions else [])
+
+    def tag_backchannel(self, type='default', model_name='all-MiniLM-L6-v2', lexicon=None, max_words=None):
+        """
+        Tag if every utterance in the corpus is a backchannel or not. See `Callyzer.tag_backchannel`.
+        """
+        backchannel = [np.asarray(self._callyzer(chunk).tag_backchannel(
+            type, inplace=False, model_name=model_name, lexicon=lexicon, max_words=max_words), dtype=bool)
+                       for chunk in self._chunks()]
+        return self._frame(is_backchannel=np.concatenate(backchannel) if backchannel else [])
+
+    def get_turn_ids(self):
+        """
+        Returns the turn id of every utterance, numbered from 0 within each call.
+        """
+        speaker = self.data[self.speaker]
+        new_turn = (speaker != speaker.shift()) | (self.data[self.call_id] != self.data[self.call_id].shift())
+        turn_ids = new_turn.cumsum()
+        turn_ids = turn_ids - turn_ids.groupby(self._codes).transform('min')
+        return self._frame(turn_id=turn_ids)
+
+    def get_gap_events(self, silence_threshold=1, interruption_threshold=1):
+        """
+        Identify periods of silence and interruption in every call. See `Callyzer.get_gap_events`.
+
+        Returns
+        -------
+        events: pd.DataFrame
+            one row per event, gaps between two calls are ignored.
+        """
+        callyzer = self._callyzer()
+        gaps = callyzer._get_gaps()
+        same_call = self._codes[1:] == self._codes[:-1]
+        silence = same_call & (gaps >= silence_threshold)
+        interruption = same_call & (-gaps >= interruption_threshold)
+        event_ids = np.flatnonzero(silence | interruption)
+
+        events = callyzer._get_channel_details(event_ids)
+        rows = self._frame().iloc[event_ids + 1]
+        events.insert(0, self.call_id, rows[self.call_id].to_numpy())
+        events['index'] = rows['utterance_idx'].to_numpy()
+        events['gap'] = gaps[event_ids]
+        events['event'] = np.where(silence[event_ids], 'silence', 'interruption')
+        return events
+
+    def get_speaker_stats(self, n_topic=2, n_process=1, batch_size=256):
+        """
+        Returns the most common linguistic attributes of every speaker in every call.
+        See `SpeakerStats.get_stats`.
+
+        Returns
+        -------
+        stats: pd.DataFrame
+            one row per (call, speaker) with the list of speaker stats.
+        """
+        stats = SpeakerStats(self.data[[self.speaker, self.utterance]], self.speaker, self.utterance,
+                             self.doc_store)
+        labels = pd.Series([j for chunk in self._chunks() for j in
+                            stats._get_summaries(chunk[self.utterance].tolist(), n_process, batch_size)],
+                           index=self.data.index, dtype=object)
+
+        rows = []
+        for (call, spk), df in labels.groupby([self.data[self.call_id], self.data[self.speaker]], sort=False):
+            df = df[~df.isin([None, "Informal, personal"])]
+            rows.append({self.call_id: call, self.speaker: spk,
+                         'speaker_stats': [i for (i, j) in Counter(df.tolist()).most_common(n_topic)]})
+        return pd.DataFrame(rows, columns=[self.call_id, self.speaker, 'speaker_stats'])
+
+    def get_speaker_profile(self, normalize=True, n_process=1, batch_size=256):
+        """
+        Returns the aggregated linguistic profile of every speaker in every call.
+        See `SpeakerStats.get_speaker_profile`.
+
+        Returns
+        -------
+        profile: pd.DataFrame
+            one row per (call, speaker) with the speaker profile.
+        """
+        stats = SpeakerStats(self.data[[self.speaker, self.utterance]], self.speaker, self.utterance,
+                             self.doc_store)
+        frames = [stats._get_stats_frame(self.doc_store.get_docs(chunk[self.utterance], n_process, batch_size),
+                                         chunk.index) for chunk in self._chunks()]
+        frame = pd.concat(frames) if frames else stats._get_stats_frame([], self.data.index)
+        return stats._get_profile(frame, [self.data[self.call_id], self.data[self.speaker]],
+                                  normalize).reset_index()
+
+    def get_segments(self, threshold=0.7, method='texttiling', window=3):
+        """
+        Returns the segments of every call. See `SemanticTextSegmentation.get_segments`.
+
+        Returns
+        -------
+        segments: pd.DataFrame
+            one row per segment with its position in the call.
+        """
+        rows = []
+        for call, df in self.data.groupby(self.call_id, sort=False):
+            segments = SemanticTextSegmentation(df, self.utterance, self.doc_store).get_segments(
+                threshold, method, window)
+            rows += [{self.call_id: call, 'segment_idx': idx, 'segment': seg}
+                     for idx, seg in enumerate(segments)]
+        return pd.DataFrame(rows, columns=[self.call_id, 'segment_idx', 'segment'])
+
+    def get_summary(self, similarity_threshold=0.65, segmentation_method='texttiling', batch_size=8,
+                    max_batch_tokens=8192):
+        """
+        Returns the summary of every call. See `TranscriptSummarization.get_summary`.
+
+        The calls are segmented one by one, the segments of all the calls are summarized together.
+
+        Returns
+        -------
+        summaries: pd.DataFrame
+            one row per call.
+        """
+        calls, texts, summarizer = [], [], None
+        for call, df in self.data.groupby(self.call_id, sort=False):
+            summarizer = TranscriptSummarization(df.reset_index(drop=True), self.utterance, self.speaker,
+                                                 similarity_threshold,
+                                                 segmentation_method=segmentation_method)
+            call_texts = summarizer._get_segment_texts()
+            calls.append((call, call_texts))
+            texts += [i for i in call_texts if i is not None]
+
+        summaries = []
+        if texts:
+            summarizer._summary_model = load_summarization_model()
+            summaries = summarizer._summarize(texts, batch_size, max_batch_tokens)
+        rows, start = [], 0
+        for call, call_texts in calls:
+            end = start + sum(i is not None for i in call_texts)
+            rows.append({self.call_id: call, 'summary': summarizer._join_summaries(call_texts,
+                                                                                   summaries[start:end])})
+            start = end
+        return pd.DataFrame(rows, columns=[self.call_id, 'summary'])
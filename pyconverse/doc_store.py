@@ -0,0 +1,126 @@
+import attr
+from collections import OrderedDict
+from .utils import load_spacy, parse_texts
+
+
+_doc_bin_attrs = ["ORTH", "TAG", "POS", "LEMMA", "HEAD", "DEP", "ENT_IOB", "ENT_TYPE"]
+
+
+@attr.s
+class DocStore:
+
+    """
+    Parsed spaCy documents of a transcript, shared by the analysers.
+
+    Every distinct text is parsed once, with `nlp.pipe`, and reused by every class the
+    store is attached to. The store can be saved to disk as a spaCy `DocBin` and loaded
+    back, so re-running an analysis with different thresholds needs no re-parse.
+
+    Paramters
+    ---------
+    max_size: int
+        maximum number of documents kept, the least recently used ones are dropped first.
+        Unbounded if None.
+
+    Example
+    -------
+    >>> store = DocStore()
+    >>> store.fill(data['utterance'])
+    >>> Callyzer(data, doc_store=store).tag_questions()
+    >>> SpeakerStats(data, doc_store=store).get_stats()
+    >>> store.to_disk('call_1.spacy')
+    """
+
+    _docs = attr.ib(factory=OrderedDict, converter=OrderedDict, repr=False)
+    max_size = attr.ib(default=None)
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, text):
+        return text in self._docs
+
+    def _remember(self, text, doc):
+        self._docs[text] = doc
+        self._docs.move_to_end(text)
+        if self.max_size is not None:
+            while len(self._docs) > self.max_size:
+                self._docs.popitem(last=False)
+
+    def _lookup(self, texts, n_process=1, batch_size=256):
+        # parsed documents of the distinct texts, also when the store is too small to keep them all
+        docs = {}
+        for text in dict.fromkeys(texts):
+            if text in self._docs:
+                docs[text] = self._docs[text]
+                self._docs.move_to_end(text)
+        missing = [i for i in dict.fromkeys(texts) if i not in docs]
+        if missing:
+            for text, doc in zip(missing, parse_texts(missing, n_process, batch_size)):
+                docs[text] = doc
+                self._remember(text, doc)
+        return docs
+
+    def fill(self, texts, n_process=1, batch_size=256):
+        """
+        Parse the texts which are not in the store yet.
+
+        Parameters
+        ----------
+        texts: list
+            list of texts to parse.
+
+        n_process: int
+            number of processes used for parsing, -1 uses all the CPU cores.
+
+        batch_size: int
+            number of texts sent to a process at a time.
+        """
+        self._lookup(texts, n_process, batch_size)
+        return self
+
+    def get_docs(self, texts, n_process=1, batch_size=256):
+        """
+        Returns the parsed documents of the texts, parsing the missing ones.
+        """
+        texts = list(texts)
+        docs = self._lookup(texts, n_process, batch_size)
+        return [docs[i] for i in texts]
+
+    def get(self, text):
+        """
+        Returns the parsed document of a text, parsing it if missing.
+        """
+        if text in self._docs:
+            self._docs.move_to_end(text)
+            return self._docs[text]
+        doc = load_spacy()(text)
+        self._remember(text, doc)
+        return doc
+
+    def to_disk(self, path):
+        """
+        Save the parsed documents to `path` as a spaCy DocBin.
+        """
+        from spacy.tokens import DocBin
+
+        doc_bin = DocBin(attrs=_doc_bin_attrs)
+        for doc in self._docs.values():
+            doc_bin.add(doc)
+        with open(path, 'wb') as f:
+            f.write(doc_bin.to_bytes())
+
+    @classmethod
+    def from_disk(cls, path, max_size=None):
+        """
+        Load a store saved with `to_disk`.
+        """
+        from spacy.tokens import DocBin
+
+        with open(path, 'rb') as f:
+            doc_bin = DocBin().from_bytes(f.read())
+        docs = doc_bin.get_docs(load_spacy().vocab)
+        store = cls(max_size=max_size)
+        for doc in docs:
+            store._remember(doc.text, doc)
+        return store
@@ -0,0 +1,248 @@
+import os
+import json
+import hashlib
+import threading
+import attr
+import numpy as np
+from collections import OrderedDict
+from .utils import load_sentence_transformer, backend_name, _locked
+
+
+def _text_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+_digest_size = hashlib.sha1().digest_size
+
+
+@attr.s
+class _DiskTier:
+    """
+    Append-only float32 matrix, memory mapped, with a parallel append-only file of the sha1
+    digests of the texts: row i of the matrix is the embedding of the i-th digest.
+
+    A write appends the new rows to both files, so its cost does not grow with the cache.
+    Only the rows complete in both files are read, and a writer drops the others before
+    appending, so a crash between the two writes cannot shift the following rows. Writers
+    take a file lock on the directory, and readers pick up the rows written by the other
+    processes from the end of the digest file. Where `fcntl` is not available (Windows)
+    only one process may write to a directory.
+    """
+
+    directory = attr.ib()
+    _index = attr.ib(factory=dict, init=False, repr=False)
+    _read = attr.ib(default=0, init=False, repr=False)
+    _dim = attr.ib(default=None, init=False, repr=False)
+    _matrix = attr.ib(default=None, init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._read_index()
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.directory, 'meta.json')
+
+    @property
+    def _keys_path(self):
+        return os.path.join(self.directory, 'keys.sha1')
+
+    @property
+    def _matrix_path(self):
+        return os.path.join(self.directory, 'embeddings.f32')
+
+    @property
+    def _lock_path(self):
+        return os.path.join(self.directory, 'lock')
+
+    def _rows(self):
+        # rows complete in both the matrix and the digest file
+        if self._dim is None:
+            return 0
+        matrix = os.path.getsize(self._matrix_path) if os.path.exists(self._matrix_path) else 0
+        keys = os.path.getsize(self._keys_path) if os.path.exists(self._keys_path) else 0
+        return min(matrix // (4 * self._dim), keys // _digest_size)
+
+    def _read_index(self):
+        if self._dim is None and os.path.exists(self._meta_path):
+            with open(self._meta_path, 'r') as f:
+                self._dim = json.load(f)['dim']
+
+        rows = self._rows()
+        if rows > self._read:
+            with open(self._keys_path, 'rb') as f:
+                f.seek(self._read * _digest_size)
+                digests = f.read((rows - self._read) * _digest_size)
+            for row in range(self._read, rows):
+                offset = (row - self._read) * _digest_size
+                self._index[digests[offset:offset + _digest_size].hex()] = row
+            self._read = rows
+
+    def get(self, key):
+        row = self._index.get(key)
+        if row is None:
+            return None
+        if self._matrix is None or row >= len(self._matrix):
+            self._matrix = np.memmap(self._matrix_path, dtype=np.float32, mode='r',
+                                     shape=(self._read, self._dim))
+        return np.array(self._matrix[row])
+
+    def add(self, keys, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with _locked(self._lock_path):
+            self._read_index()
+            if self._dim is not None and self._dim != vectors.shape[1]:
+                raise ValueError("Embedding dimension {} does not match the cache dimension {}".format(
+                    vectors.shape[1], self._dim))
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+                tmp_path = self._meta_path + '.tmp'
+                with open(tmp_path, 'w') as f:
+                    json.dump(dict(dim=self._dim), f)
+                os.replace(tmp_path, self._meta_path)
+
+            # drop partially written rows, then append after the last complete one,
+            # the matrix first so a digest never points past the matrix
+            start = self._rows()
+            with open(self._matrix_path, 'ab') as f:
+                f.truncate(start * 4 * self._dim)
+                f.write(vectors.tobytes())
+            with open(self._keys_path, 'ab') as f:
+                f.truncate(start * _digest_size)
+                f.write(b''.join(bytes.fromhex(i) for i in keys))
+            self._read_index()
+
+
+@attr.s
+class EmbeddingCache:
+
+    """
+    Content addressed cache of sentence-transformer embeddings.
+
+    Embeddings are keyed by (model name, sha1 of the text) and kept in an in-memory LRU.
+    Models run with the onnx backend are cached apart from the torch ones.
+    When `path` is given, they are also persisted per model as a memory mapped float32
+    matrix plus an append-only file of text digests, shared between runs. Only the texts missing from both tiers
+    are encoded, in batches.
+
+    Paramters
+    ---------
+    max_size: int
+        maximum number of embeddings kept in memory.
+
+    path: str
+        directory of the on-disk tier, disabled if None. Several processes may share it
+        (one writer at a time where `fcntl` is not available).
+
+    Example
+    -------
+    >>> from pyconverse import default_embedding_cache
+    >>> default_embedding_cache.path = '/var/cache/pyconverse/embeddings'
+    >>> Callyzer(data).tag_backchannel(type='nlp')
+    >>> default_embedding_cache.stats()
+    {'hits': 612, 'misses': 95, 'size': 95, 'hit_rate': 0.865...}
+    """
+
+    max_size = attr.ib(default=100000)
+    path = attr.ib(default=None)
+    hits = attr.ib(default=0, init=False)
+    misses = attr.ib(default=0, init=False)
+    _memory = attr.ib(factory=OrderedDict, init=False, repr=False)
+    _disk = attr.ib(factory=dict, init=False, repr=False)
+    _lock = attr.ib(factory=threading.RLock, init=False, repr=False)
+
+    def _disk_tier(self, model_name):
+        if self.path is None:
+            return None
+        if model_name not in self._disk:
+            directory = os.path.join(self.path, model_name.replace('/', '__'))
+            self._disk[model_name] = _DiskTier(directory)
+        return self._disk[model_name]
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def encode(self, texts, model_name='all-MiniLM-L6-v2', batch_size=32):
+        """
+        Returns the embeddings of the texts, encoding only the cache misses.
+
+        Parameters
+        ----------
+        texts: list
+            list of texts to encode.
+
+        model_name: str
+            sentence transformer model name.
+
+        batch_size: int
+            batch size used to encode the cache misses.
+
+        Returns
+        -------
+        embeddings: np.ndarray
+            float32 array of shape (len(texts), embedding dimension).
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        texts = list(texts)
+
+        backend = backend_name()
+        cache_name = model_name if backend == 'torch' else '{}@{}'.format(model_name, backend)
+
+        with self._lock:
+            disk = self._disk_tier(cache_name)
+            keys = [_text_hash(i) for i in texts]
+            vectors = {}
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key in vectors or key in missing:
+                    continue
+                vector = self._memory.get((cache_name, key))
+                if vector is None and disk is not None:
+                    vector = disk.get(key)
+                if vector is None:
+                    missing[key] = text
+                else:
+                    vectors[key] = vector
+                    self._remember((cache_name, key), vector)
+            self.misses += len(missing)
+            self.hits += len(texts) - len(missing)
+
+        # the misses are encoded without the lock, so threads sharing the cache encode concurrently
+        if missing:
+            model = load_sentence_transformer(model_name)
+            encoded = model.encode(list(missing.values()), batch_size=batch_size)
+            encoded = np.asarray(encoded, dtype=np.float32)
+            with self._lock:
+                for key, vector in zip(missing, encoded):
+                    vectors[key] = vector
+                    self._remember((cache_name, key), vector)
+                if disk is not None:
+                    disk.add(list(missing), encoded)
+
+        if not texts:
+            dim = load_sentence_transformer(model_name).get_sentence_embedding_dimension()
+            return np.empty((0, dim), dtype=np.float32)
+        return np.stack([vectors[i] for i in keys])
+
+    def stats(self):
+        """
+        Returns the hit/miss counters of the cache.
+        """
+        total = self.hits + self.misses
+        return dict(hits=self.hits, misses=self.misses, size=len(self._memory),
+                    hit_rate=self.hits / total if total else 0.0)
+
+    def clear(self):
+        """
+        Drop the in-memory embeddings and reset the counters. The on-disk tier is kept.
+        """
+        with self._lock:
+            self._memory.clear()
+            self.hits = self.misses = 0
+
+
+default_embedding_cache = EmbeddingCache()
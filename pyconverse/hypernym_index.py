@@ -0,0 +1,236 @@
+import os
+import sqlite3
+import logging
+import threading
+import attr
+from collections import OrderedDict
+from .utils import _locked
+
+logger = logging.getLogger(__name__)
+
+
+def _wordnet_hypernyms(word):
+    from nltk.corpus import wordnet as wn
+
+    parents = [j.name().split('.') for i in wn.synsets(word)[:2] for j in i.hypernyms()]
+    return tuple(i[0] for i in parents if i[1] != 'v')
+
+
+@attr.s
+class HypernymIndex:
+
+    """
+    Keyword to WordNet hypernym index.
+
+    The hypernyms of a keyword are the non-verb hypernyms of its first two synsets, as used by
+    `ZeroShotTopicFinder.get_parent_words`. They are read from an sqlite file built once with
+    `build`, behind an in-memory LRU. Keywords missing from the file (inflected forms such as
+    "payments") are looked up in WordNet once and added to it.
+
+    The shared `default_hypernym_index` lives in ~/.cache/pyconverse/hypernyms.sqlite, or in
+    the file named by the PYCONVERSE_HYPERNYM_INDEX environment variable (empty to keep it in
+    memory only), see also `warmup(hypernym_index_path=...)`. It is built from the whole of
+    WordNet the first time it is needed: when a `ZeroShotTopicFinder` is created, or with
+    `warmup(['hypernyms'])`, never inside `find_topic`. Processes starting together build it
+    once, under a file lock. When the file cannot be created or written, a warning is logged
+    and the index stays in memory.
+
+    Paramters
+    ---------
+    path: str
+        sqlite file of the index, WordNet is used for every new keyword if None or not writable.
+
+    max_size: int
+        maximum number of keywords kept in memory.
+
+    auto_build: bool
+        build the index from WordNet in `ensure_built` if the file does not hold a complete one.
+
+    Example
+    -------
+    >>> from pyconverse import default_hypernym_index
+    >>> default_hypernym_index.ensure_built()
+    >>> default_hypernym_index.get('refund')
+    ('repayment',)
+    """
+
+    path = attr.ib(default=None)
+    max_size = attr.ib(default=50000)
+    auto_build = attr.ib(default=False)
+    hits = attr.ib(default=0, init=False)
+    misses = attr.ib(default=0, init=False)
+    _memory = attr.ib(factory=OrderedDict, init=False, repr=False)
+    _connection = attr.ib(default=None, init=False, repr=False)
+    _lock = attr.ib(factory=threading.RLock, init=False, repr=False)
+
+    def _db(self):
+        if self.path is None:
+            return None
+        if self._connection is None:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                connection = sqlite3.connect(self.path, check_same_thread=False)
+                with connection:
+                    connection.execute('CREATE TABLE IF NOT EXISTS hypernyms '
+                                       '(word TEXT PRIMARY KEY, parents TEXT) WITHOUT ROWID')
+                    connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            except (OSError, sqlite3.Error) as e:
+                logger.warning("Cannot open the hypernym index %s (%s), keeping it in memory", self.path, e)
+                self.path = None
+                return None
+            self._connection = connection
+        return self._connection
+
+    def set_path(self, path):
+        """
+        Move the index to another sqlite file, None to keep it in memory only.
+        """
+        with self._lock:
+            self.close()
+            self.path = path
+        return self
+
+    def is_built(self):
+        """
+        Returns True if the sqlite file holds the hypernyms of every WordNet lemma.
+        """
+        with self._lock:
+            db = self._db()
+            return db is not None and db.execute(
+                "SELECT value FROM meta WHERE key = 'complete'").fetchone() is not None
+
+    def ensure_built(self):
+        """
+        Build the index from WordNet if `auto_build` is set and it is not built yet.
+        """
+        with self._lock:
+            if not self.auto_build or self.is_built() or self.path is None:
+                return self
+            # concurrent processes wait for the first one and find the index built
+            try:
+                with _locked(self.path + '.lock'):
+                    if not self.is_built():
+                        self.build()
+            except (OSError, sqlite3.Error) as e:
+                logger.warning("Cannot build the hypernym index %s (%s), keeping it in memory", self.path, e)
+                self.close()
+                self.path = None
+        return self
+
+    def _remember(self, word, parents):
+        self._memory[word] = parents
+        self._memory.move_to_end(word)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def get(self, word):
+        """
+        Returns the hypernyms of a keyword.
+
+        Parameters
+        ----------
+        word: str
+            keyword to expand.
+
+        Returns
+        -------
+        parents: tuple
+            hypernym lemma names, in WordNet order.
+        """
+        with self._lock:
+            parents = self._memory.get(word)
+            if parents is not None:
+                self.hits += 1
+                self._memory.move_to_end(word)
+                return parents
+
+            db = self._db()
+            row = None if db is None else db.execute(
+                'SELECT parents FROM hypernyms WHERE word = ?', (word,)).fetchone()
+            if row is not None:
+                self.hits += 1
+                parents = tuple(row[0].split())
+            else:
+                self.misses += 1
+                parents = _wordnet_hypernyms(word)
+                if db is not None:
+                    try:
+                        with db:
+                            db.execute('INSERT OR REPLACE INTO hypernyms VALUES (?, ?)',
+                                       (word, ' '.join(parents)))
+                    except sqlite3.Error as e:
+                        logger.warning("Cannot write to the hypernym index %s (%s)", self.path, e)
+            self._remember(word, parents)
+            return parents
+
+    def build(self, path=None, words=None, batch_size=10000):
+        """
+        Precompute the hypernyms of the keywords and write them to the sqlite file.
+
+        Parameters
+        ----------
+        path: str
+            sqlite file of the index, replaces `path` when given.
+
+        words: list
+            keywords to index, every WordNet lemma name by default.
+
+        batch_size: int
+            number of keywords written per transaction.
+        """
+        with self._lock:
+            if path is not None:
+                self.close()
+                self.path = path
+            db = self._db()
+            if db is None:
+                raise ValueError("Please pass the path of the index file")
+
+            complete = words is None
+            if complete:
+                from nltk.corpus import wordnet as wn
+                words = wn.all_lemma_names()
+
+            rows = []
+            for word in words:
+                rows.append((word, ' '.join(_wordnet_hypernyms(word))))
+                if len(rows) >= batch_size:
+                    with db:
+                        db.executemany('INSERT OR REPLACE INTO hypernyms VALUES (?, ?)', rows)
+                    rows = []
+            with db:
+                db.executemany('INSERT OR REPLACE INTO hypernyms VALUES (?, ?)', rows)
+                if complete:
+                    db.execute("INSERT OR REPLACE INTO meta VALUES ('complete', '1')")
+            self._memory.clear()
+
+    def stats(self):
+        """
+        Returns the hit/miss counters of the index.
+        """
+        total = self.hits + self.misses
+        return dict(hits=self.hits, misses=self.misses, size=len(self._memory),
+                    hit_rate=self.hits / total if total else 0.0)
+
+    def close(self):
+        """
+        Close the sqlite file and drop the in-memory keywords.
+        """
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+            self._memory.clear()
+
+
+def _default_index_path():
+    # an empty PYCONVERSE_HYPERNYM_INDEX keeps the default index in memory
+    return os.environ.get('PYCONVERSE_HYPERNYM_INDEX', os.path.join(
+        os.path.expanduser('~'), '.cache', 'pyconverse', 'hypernyms.sqlite')) or None
+
+
+default_index_path = _default_index_path()
+
+default_hypernym_index = HypernymIndex(default_index_path, auto_build=True)
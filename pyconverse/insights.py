@@ -1,14 +1,56 @@
 import attr
-import spacy
 import numpy as np
 import pandas as pd
-from ._const import backchannel as constants
-from .utils import load_sentence_transformer, remove_punct, load_spacy, load_zeroshot_model
-from sklearn.metrics.pairwise import cosine_similarity
+from .backchannel import BackchannelMatcher, default_matcher
+from .embedding_cache import default_embedding_cache
+from .registry import model_registry
+from .utils import backend_name
+from .doc_store import DocStore
+from .classification import label_set_scores, label_threshold, top_labels, embedding_thresholds
+from .batching import MicroBatcher
 
 
-nlp = load_spacy()
-classifier = load_zeroshot_model()
+emotion_labels = ['Surprised', 'Angry', 'Sad', 'Annoyed', 'Lonely',
+                  'Guilty', 'Impressed', 'Disgusted', 'Confident', 'Anxious',
+                  'Joyful', 'Jealous', 'Caring', 'Sentimental', 'Neutral']
+
+empathy_labels = ['empathy', 'non_empathetic', 'Neutral']
+
+# embedding backend "not found" thresholds of the built-in label sets, the scores of a best
+# label one temperature above the others (`classification.margin_threshold`). Replace them
+# with `calibrate_embedding_thresholds` on a sample of your own utterances.
+embedding_thresholds.setdefault(tuple(emotion_labels), 0.163)
+embedding_thresholds.setdefault(tuple(empathy_labels), 0.576)
+
+
+backchannel_prototypes = ["hmmm", "yeah okay",
+                          "oh really", "oh wow", "thats good", "cool"]
+
+
+def _backchannel_prototype(model_name):
+    # mean embedding of the prototype phrases, computed once per model and kept in the model registry
+    def loader():
+        vectors = default_embedding_cache.encode(backchannel_prototypes, model_name)
+        return np.mean(vectors, axis=0)
+
+    return model_registry.get('backchannel-prototype', model_name, loader, backend=backend_name())
+
+
+def _tag_emotion_batch(items):
+    # items are (text, backend), every backend of the batch is scored in one call
+    classes = [None] * len(items)
+    for backend in set(j for _, j in items):
+        index = [i for i, (_, j) in enumerate(items) if j == backend]
+        scores = label_set_scores([items[i][0] for i in index], {'emotion': emotion_labels},
+                                  backend=backend)['emotion']
+        threshold = label_threshold(emotion_labels, backend)
+        for i, label in zip(index, top_labels(scores, emotion_labels, threshold)):
+            classes[i] = label
+    return classes
+
+
+# shared by every Callyzer so concurrent requests are batched together
+emotion_batcher = MicroBatcher(_tag_emotion_batch)
 
 
 @attr.s
@@ -33,6 +75,9 @@ class Callyzer:
 
     endtime: str
          pass the column name which represent end time for utterance in transcript dataframe
+
+    doc_store: DocStore
+        store of parsed spacy documents, share one between analysers to parse the transcript only once.
     """
 
     data = attr.ib()
@@ -40,8 +85,12 @@ class Callyzer:
     speaker = attr.ib(default='speaker')
     starttime = attr.ib(default='startTime')
     endtime = attr.ib(default='endTime')
+    doc_store = attr.ib(default=None)
 
     def __attrs_post_init__(self):
+        if self.doc_store is None:
+            self.doc_store = DocStore()
+
         columns = self.data.columns.tolist()
         if self.speaker not in columns:
             raise ValueError("Please pass proper speaker column")
@@ -57,7 +106,7 @@ class Callyzer:
             raise ValueError(
                 "Please pass proper endtime column. We need to calculate feature like silence, interruption etc")
 
-    def get_interruption(self, threshold=1):
+    def get_interruption(self, threshold=1, as_frame=False):
         """
         Identify periods of interruption in a call.
 
@@ -66,26 +115,25 @@ class Callyzer:
         threshold: int
             Minimun overlap seconds between two users to consider as interrptions.
 
+        as_frame: bool
+            Return a dataframe with one row per interruption instead of the speaker wise dict.
+
         Returns
         -------
-        return_dict: dict
+        return_dict: dict or pd.DataFrame
             Returns the speaker wise interruption with time stamps..
 
         """
-        return_dict = {}
-        start_times = self.data[self.starttime].tolist()
-        end_times = self.data[self.endtime].tolist()
-        interrupt_ids = []
-
-        for index, (et, st) in enumerate(zip(end_times[:-1], start_times[1:])):
-            if et - st >= threshold:
-                interrupt_ids.append(index)
+        interrupt_ids = np.flatnonzero(-self._get_gaps() >= threshold)
+        details = self._get_channel_details(interrupt_ids)
+        if as_frame:
+            return details
 
-        return_dict = self._get_channel_details(interrupt_ids)
+        return_dict = self._group_channel_details(details)
         return_dict['total_interruption'] = len(interrupt_ids)
         return return_dict
 
-    def get_silence(self, threshold=1):
+    def get_silence(self, threshold=1, as_frame=False):
         """
         Identify periods of silence in a call.
 
@@ -94,24 +142,57 @@ class Callyzer:
         threshold: int
             Minimun non-talk seconds between two users to consider as silence.
 
+        as_frame: bool
+            Return a dataframe with one row per silence instead of the speaker wise dict.
+
         Returns
         -------
-        return_dict: dict
+        return_dict: dict or pd.DataFrame
             Returns the speaker wise silence with time stamps.
 
         """
-        return_dict = {}
-        start_times = self.data[self.starttime].tolist()
-        end_times = self.data[self.endtime].tolist()
-        interrupt_ids = []
-
-        for index, (et, st) in enumerate(zip(end_times[:-1], start_times[1:])):
-            if st - et >= threshold:
-                interrupt_ids.append(index)
-        return_dict = self._get_channel_details(interrupt_ids)
+        interrupt_ids = np.flatnonzero(self._get_gaps() >= threshold)
+        details = self._get_channel_details(interrupt_ids)
+        if as_frame:
+            return details
+
+        return_dict = self._group_channel_details(details)
         return_dict['total_interruption'] = len(interrupt_ids)
         return return_dict
 
+    def get_gap_events(self, silence_threshold=1, interruption_threshold=1):
+        """
+        Identify periods of silence and interruption in a call in a single pass.
+
+        Parameters
+        ----------
+        silence_threshold: int
+            Minimun non-talk seconds between two users to consider as silence.
+
+        interruption_threshold: int
+            Minimun overlap seconds between two users to consider as interrptions.
+
+        Returns
+        -------
+        events: pd.DataFrame
+            one row per event with the speaker, start/end time and index of the utterance
+            following the gap, the gap in seconds (negative for overlaps) and the event type.
+        """
+        gaps = self._get_gaps()
+        silence = gaps >= silence_threshold
+        interruption = -gaps >= interruption_threshold
+        event_ids = np.flatnonzero(silence | interruption)
+
+        events = self._get_channel_details(event_ids)
+        events['gap'] = gaps[event_ids]
+        events['event'] = np.where(silence[event_ids], 'silence', 'interruption')
+        return events
+
+    def _get_gaps(self):
+        start_times = self.data[self.starttime].to_numpy(dtype=float)
+        end_times = self.data[self.endtime].to_numpy(dtype=float)
+        return start_times[1:] - end_times[:-1]
+
     def convert_at_turn(self):
         """
         Convert utterance to turns
@@ -120,54 +201,53 @@ class Callyzer:
         return df
 
     def _collapse_df(self,):
-        tp = []
         df = self.get_turn_ids()
-        for i, j in self.data.groupby(by="turn_id"):
-            temp = j.iloc[0]
-            if len(j) > 1:
-                temp[self.utterance] = ' '.join(j[self.utterance].tolist())
-                temp[self.endtime] = j.iloc[-1][self.endtime]
-            tp.append(temp)
-        tp = pd.concat(tp, axis=1).T
-        return tp
+        # positional masks, the transcript index may have duplicate labels
+        turn_ids = df['turn_id'].to_numpy()
+        first = ~df['turn_id'].duplicated().to_numpy()
+        last = ~df['turn_id'].duplicated(keep='last').to_numpy()
+        turns = df[first].copy()
+
+        # only turns of several utterances are joined, single ones are kept as they are
+        multi = df['turn_id'].duplicated(keep=False).to_numpy()
+        texts = df[self.utterance].to_numpy()[multi]
+        present = pd.notna(texts)
+        joined = pd.Series(texts[present]).astype(str).groupby(
+            turn_ids[multi][present], sort=False).agg(' '.join)
+        utterances = turns[self.utterance].to_numpy(dtype=object)
+        is_joined = np.isin(turn_ids[first], joined.index)
+        utterances[is_joined] = joined[turn_ids[first][is_joined]].to_numpy()
+        turns[self.utterance] = utterances
+
+        turns[self.endtime] = df[self.endtime].to_numpy()[last]
+        return turns
 
     def get_turn_ids(self, in_place=True):
-        turn = 0
-        channel = None
-        return_data = None
-        turn_list = []
-
-        for i, j in self.data.iterrows():
-            if channel is None:
-                channel = j[self.speaker]
-
-            if channel != j[self.speaker]:
-                channel = j[self.speaker]
-                turn += 1
-            turn_list.append(turn)
+        speaker = self.data[self.speaker]
+        turn_ids = (speaker != speaker.shift()).cumsum() - 1
 
         if in_place:
-            self.data['turn_id'] = turn_list
+            self.data['turn_id'] = turn_ids
             return self.data
         else:
-            return turn_list
+            return turn_ids.tolist()
 
     def _get_channel_details(self, id_list):
+        index = np.asarray(id_list, dtype=int) + 1
+        return pd.DataFrame({'speaker': self.data[self.speaker].to_numpy()[index],
+                             'start_time': self.data[self.starttime].to_numpy()[index],
+                             'end_time': self.data[self.endtime].to_numpy()[index],
+                             'index': index})
+
+    def _group_channel_details(self, details):
         channels = self.data[self.speaker].unique()
         return_dict = {k: dict(metadata=[], count=0) for k in channels}
-        for idx in id_list:
-            ch = self.data.iloc[idx+1]
-            channel = ch.get(self.speaker)
-            _ = dict(start_time=ch.get(self.starttime),
-                     end_time=ch.get(self.endtime), index=idx+1)
-
-            update_data = return_dict[channel]
-            update_data['count'] = update_data['count'] + 1
-            update_data['metadata'] = update_data['metadata']+[_]
-            return_dict[channel] = update_data
+        for channel, df in details.groupby('speaker', sort=False):
+            metadata = df[['start_time', 'end_time', 'index']].to_dict('records')
+            return_dict[channel] = dict(metadata=metadata, count=len(metadata))
         return return_dict
 
-    def tag_questions(self, inplace=True):
+    def tag_questions(self, inplace=True, n_process=1, batch_size=256):
         """
         For utterance, tag if it is a question or not.
 
@@ -176,19 +256,30 @@ class Callyzer:
         inplace: bool
            Add the new column in to dataframe if inplace is True.
 
+        n_process: int
+           number of processes used to parse the utterances with spacy, -1 uses all the CPU cores.
+
+        batch_size: int
+           number of utterances sent to a spacy process at a time.
+
         Returns
         -------
         questions: pd.dataframe or pd.Series
             Returns the dataframe or series 
         """
-        questions = self.data[self.utterance].apply(self._is_text_question)
+        texts = self.data[self.utterance]
+        questions = pd.Series(False, index=texts.index)
+        to_parse = texts.str.len() >= 10
+        docs = self.doc_store.get_docs(texts[to_parse], n_process, batch_size)
+        questions[to_parse] = [self._is_doc_question(doc) for doc in docs]
         if inplace:
             self.data['is_question'] = questions
             return self.data
         else:
             return questions
 
-    def tag_backchannel(self, type='default', inplace=True, model_name='all-MiniLM-L6-v2'):
+    def tag_backchannel(self, type='default', inplace=True, model_name='all-MiniLM-L6-v2', lexicon=None,
+                        max_words=None):
         """
         For utterance, tag if it a backchannel or not.
         Supports two methods to do this, by default - it uses a dictionary of known backchannels to identify(fast, less precise.)
@@ -206,18 +297,28 @@ class Callyzer:
         model_name: str 
             Pass the any sentence transfromer model name which use similary when backchannel type is nlp
 
+        lexicon: list or BackchannelMatcher
+            backchannel phrases (or matcher) used when backchannel type is default, the built-in list if None.
+
+        max_words: int
+            when backchannel type is nlp, utterances with more words than this are tagged False without being encoded.
+
         Returns
         -------
         questions: pd.dataframe or pd.Series
             Returns the dataframe or series 
         """
         if type == 'default':
-            backchannel = self.data[self.utterance].apply(
-                lambda x: self._is_backchannel(x))
+            matcher = default_matcher
+            if isinstance(lexicon, BackchannelMatcher):
+                matcher = lexicon
+            elif lexicon is not None:
+                matcher = BackchannelMatcher(lexicon)
+            backchannel = matcher.match(self.data[self.utterance])
 
         elif type == "nlp":
             backchannel = self._nlp_backchannel(
-                self.data[self.utterance].tolist(), model_name)
+                self.data[self.utterance].tolist(), model_name, max_words)
 
         else:
             raise ValueError(
@@ -230,38 +331,34 @@ class Callyzer:
             return backchannel
 
     def _is_backchannel(self, text):
-        is_back_ch = False
-        clean_text = remove_punct(text)
-
-        if text in constants or text.lower() in constants:
-            is_back_ch = True
-
-        if clean_text in constants or clean_text.lower() in constants:
-            is_back_ch = True
+        return default_matcher.is_backchannel(text)
 
-        return is_back_ch
-
-    def _nlp_backchannel(self, utterances, model='all-MiniLM-L6-v2'):
+    def _nlp_backchannel(self, utterances, model='all-MiniLM-L6-v2', max_words=None):
         if isinstance(utterances, str):
             utterances = [utterances]
 
-        return_list = [False]*len(utterances)
-        model = load_sentence_transformer(model)
-        back_channel = ["hmmm", "yeah okay",
-                        "oh really", "oh wow", "thats good", "cool"]
-        back_ch_vect = model.encode(back_channel)
-        back_ch_vect = [np.mean(back_ch_vect, axis=0)]
-        utterance_vect = model.encode(utterances)
-        sim = cosine_similarity(back_ch_vect, utterance_vect)[0]
-        for idx, i in enumerate(sim):
-            if i >= 0.55 or abs(i-0.55) < 0.05:
-                return_list[idx] = True
-        return return_list
+        return_list = np.zeros(len(utterances), dtype=bool)
+        candidates = np.arange(len(utterances))
+        if max_words is not None:
+            n_words = np.fromiter((len(i.split()) for i in utterances), dtype=int, count=len(utterances))
+            candidates = candidates[n_words <= max_words]
+        if not len(candidates):
+            return return_list.tolist()
+
+        back_ch_vect = _backchannel_prototype(model)
+        utterance_vect = default_embedding_cache.encode([utterances[i] for i in candidates], model)
+        norm = np.linalg.norm(utterance_vect, axis=1) * np.linalg.norm(back_ch_vect)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sim = np.where(norm > 0, utterance_vect @ back_ch_vect / norm, 0.0)
+        return_list[candidates] = (sim >= 0.55) | (np.abs(sim - 0.55) < 0.05)
+        return return_list.tolist()
 
     def _is_text_question(self, text):
         if len(text) < 10:
             return False
-        doc = nlp(text)
+        return self._is_doc_question(self.doc_store.get(text))
+
+    def _is_doc_question(self, doc):
         wh_tags = ["WDT", "WP", "WP$", "WRB"]
         wh_words = [t for t in doc if t.tag_ in wh_tags]
         start_with_wh = wh_words and wh_words[0].i == 0
@@ -274,7 +371,7 @@ class Callyzer:
         else:
             return False
 
-    def tag_emotion(self, inplace=True):
+    def tag_emotion(self, inplace=True, batch_size=32, backend='nli'):
         """
         For utterance, tag what emotion we found. 
         Emotions that we identify here: 
@@ -287,46 +384,113 @@ class Callyzer:
         inplace: bool
            Add the new column in to dataframe if inplace is True.
 
+        batch_size: int
+           number of (utterance, emotion) pairs scored per model forward pass.
+
+        backend: str, nli or embedding
+           `nli` scores every (utterance, emotion) pair with the bart-large-mnli zero-shot model,
+           `embedding` compares sentence-transformer embeddings, much faster but a little less accurate.
+           Its "not found" threshold is the default one of the emotion labels, or the one fitted
+           with `classification.calibrate_embedding_thresholds`.
+
         Returns
         -------
         questions: pd.dataframe or pd.Series
             Returns the dataframe or series 
         """
+        texts = self.data[self.utterance].tolist()
+        classes = self._classifier(texts, emotion_labels, batch_size, backend)
+        if inplace:
+            self.data['emotion'] = classes
+            return self.data
+        else:
+            return classes
+
+    async def atag_emotion(self, inplace=True, backend='nli'):
+        """
+        Asyncio version of `tag_emotion`.
+
+        The utterances are queued on the shared `emotion_batcher`, batched together with the ones
+        of other concurrent calls and tagged in a worker thread, so the event loop is not blocked.
+
+        Parameters
+        ----------
+        inplace: bool
+           Add the new column in to dataframe if inplace is True.
 
-        candidate_labels = ['Surprised', 'Angry', 'Sad', 'Annoyed', 'Lonely',
-                            'Guilty', 'Impressed', 'Disgusted', 'Confident', 'Anxious',
-                            'Joyful', 'Jealous', 'Caring', 'Sentimental', 'Neutral']
+        backend: str, nli or embedding
+           labeling backend, see `tag_emotion`.
 
+        Returns
+        -------
+        questions: pd.dataframe or list
+            Returns the dataframe or list of emotions
+        """
         texts = self.data[self.utterance].tolist()
-        classes = self._classifier(texts, candidate_labels)
+        classes = await emotion_batcher.submit([(i, backend) for i in texts])
         if inplace:
             self.data['emotion'] = classes
             return self.data
         else:
             return classes
 
-    def tag_empathy(self, inplace=True):
+    def tag_empathy(self, inplace=True, batch_size=32, backend='nli'):
         """
-        Tag if the utterance is empathetic or not.
+        Tag if the utterance is empathetic or not. See `tag_emotion` for the backends.
         """
-        candidate_labels = ['empathy', 'non_empathetic', 'Neutral']
         texts = self.data[self.utterance].tolist()
-        classes = self._classifier(texts, candidate_labels)
+        classes = self._classifier(texts, empathy_labels, batch_size, backend)
         if inplace:
             self.data['is_empathy'] = classes
             return self.data
         else:
             return classes
 
-    def _classifier(self, texts, candidate_labels):
+    def tag_labels(self, label_sets=None, inplace=True, batch_size=32, backend='nli'):
+        """
+        Tag utterances against several candidate label sets in a single batched pass.
+        Every utterance is tokenized once and labels shared between the sets are scored once,
+        so tagging emotion and empathy together costs about as much as one of them.
+
+        Parameters
+        ----------
+        label_sets: dict
+           mapping of column name to its candidate labels.
+           defaults to {'emotion': emotion labels, 'is_empathy': empathy labels}.
+
+        inplace: bool
+           Add the new columns in to dataframe if inplace is True.
+
+        batch_size: int
+           number of (utterance, label) pairs scored per model forward pass.
+
+        backend: str, nli or embedding
+           labeling backend, see `tag_emotion`.
+
+        Returns
+        -------
+        classes: pd.dataframe
+            Returns the dataframe, or a dataframe holding only the new columns if inplace is False.
+        """
+        if label_sets is None:
+            label_sets = {'emotion': emotion_labels, 'is_empathy': empathy_labels}
+
+        texts = self.data[self.utterance].tolist()
+        scores = label_set_scores(texts, label_sets, batch_size, backend)
+        classes = pd.DataFrame({name: top_labels(scores[name], labels, label_threshold(labels, backend))
+                                for name, labels in label_sets.items()},
+                               index=self.data.index)
+        if inplace:
+            for name in label_sets:
+                self.data[name] = classes[name]
+            return self.data
+        else:
+            return classes
+
+    def _classifier(self, texts, candidate_labels, batch_size=32, backend='nli'):
         if isinstance(texts, str):
             texts = [texts]
 
-        return_data = []
-        for text in texts:
-            resp = classifier(text, candidate_labels=candidate_labels)
-            if resp['scores'][0] >= 0.45:
-                return_data.append(resp['labels'][0])
-            else:
-                return_data.append("not found")
-        return return_data
+        scores = label_set_scores(
+            texts, {'labels': candidate_labels}, batch_size, backend)['labels']
+        return top_labels(scores, candidate_labels, label_threshold(candidate_labels, backend))
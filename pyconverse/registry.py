@@ -0,0 +1,115 @@
+import gc
+import os
+import sys
+import threading
+import attr
+
+
+@attr.s
+class ModelRegistry:
+    """
+    Process-wide store of loaded models.
+
+    Every model is keyed by (task, model name, device, dtype, backend) and loaded at most
+    once, so all the analysers share the same instance.
+
+    Example
+    -------
+    >>> from pyconverse import model_registry
+    >>> model_registry.memory_usage()
+    {('zero-shot-classification', 'facebook/bart-large-mnli', -1, None, 'torch'): 1629434888}
+    >>> model_registry.unload('zero-shot-classification')
+    """
+
+    _models = attr.ib(factory=dict, repr=False)
+    _lock = attr.ib(factory=threading.RLock, repr=False)
+
+    def get(self, task, model_name, loader, device=-1, dtype=None, backend='torch'):
+        """
+        Return the model for the key, calling `loader()` on the first request.
+        """
+        key = (task, model_name, device, dtype, backend)
+        model = self._models.get(key)
+        if model is not None:
+            return model
+
+        with self._lock:
+            if key not in self._models:
+                self._models[key] = loader()
+            return self._models[key]
+
+    def loaded(self):
+        """
+        Returns the keys of the currently loaded models.
+        """
+        return list(self._models)
+
+    def unload(self, task=None, model_name=None):
+        """
+        Drop loaded models so their memory can be reclaimed.
+
+        Parameters
+        ----------
+        task: str
+            only unload models of this task. Unloads every task if None.
+
+        model_name: str
+            only unload models with this name. Unloads every model if None.
+
+        Returns
+        -------
+        keys: list
+            keys of the unloaded models.
+        """
+        with self._lock:
+            keys = [k for k in self._models
+                    if (task is None or k[0] == task) and (model_name is None or k[1] == model_name)]
+            for key in keys:
+                del self._models[key]
+
+        if keys:
+            _release_memory()
+        return keys
+
+    def memory_usage(self):
+        """
+        Returns the approximate memory held by each loaded model, in bytes.
+        """
+        return {key: _model_nbytes(model) for key, model in list(self._models.items())}
+
+
+def _model_nbytes(model):
+    # transformers pipelines wrap the network in `.model`
+    module = getattr(model, 'model', model)
+    if hasattr(module, 'parameters'):
+        tensors = list(module.parameters())
+        if hasattr(module, 'buffers'):
+            tensors += list(module.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+
+    # ONNX Runtime models, approximated by the size of their onnx files
+    directory = getattr(module, 'model_save_dir', None)
+    if directory is not None and os.path.isdir(directory):
+        files = getattr(module, 'onnx_paths', None) or [
+            os.path.join(directory, i) for i in os.listdir(directory) if i.endswith('.onnx')]
+        return sum(os.path.getsize(i) for i in files)
+
+    # spacy pipelines
+    if hasattr(model, 'to_bytes'):
+        return len(model.to_bytes())
+
+    # numpy arrays
+    if hasattr(model, 'nbytes'):
+        return model.nbytes
+
+    return None
+
+
+def _release_memory():
+    gc.collect()
+    torch = sys.modules.get('torch')
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+model_registry = ModelRegistry()
@@ -1,12 +1,8 @@
 import attr
 import pandas as pd
 import numpy as np
-from .utils import load_sentence_transformer, load_spacy
-from nltk.tokenize.texttiling import TextTilingTokenizer
-from sklearn.metrics.pairwise import cosine_similarity
-
-model = load_sentence_transformer()
-nlp = load_spacy()
+from .embedding_cache import default_embedding_cache
+from .doc_store import DocStore
 
 
 @attr.s
@@ -24,15 +20,21 @@ class SemanticTextSegmentation:
     utterance: str
         pass the column name which represent utterance in transcript dataframe
 
+    doc_store: DocStore
+        store of parsed spacy documents, share one between analysers to parse the transcript only once.
+
     """
 
     data = attr.ib()
     utterance = attr.ib(default='utterance')
+    doc_store = attr.ib(default=None)
 
     def __attrs_post_init__(self):
         columns = self.data.columns.tolist()
+        if self.doc_store is None:
+            self.doc_store = DocStore()
 
-    def get_segments(self, threshold=0.7):
+    def get_segments(self, threshold=0.7, method='texttiling', window=3):
         """
         returns the transcript segments computed with texttiling and sentence-transformer.
 
@@ -41,23 +43,68 @@ class SemanticTextSegmentation:
         threshold: float
             sentence similarity threshold. (used to merge the sentences into coherant segments)
 
+        method: str, texttiling or embedding
+            how the initial segments are found. `texttiling` uses NLTK TextTiling over the joined
+            transcript, `embedding` uses depth scores over utterance embedding similarities (faster on long calls).
+
+        window: int
+            number of utterances compared on each side of a candidate boundary when method is embedding.
+
         Return
         ------
         new_segments: list
             list of segments        
         """
-        segments = self._text_tilling()
-        merge_index = self._merge_segments(segments, threshold)
+        segments, _, merge_index = self._segment(threshold, method, window)
         new_segments = []
         for i in merge_index:
             seg = ' '.join([segments[_] for _ in i])
             new_segments.append(seg)
         return new_segments
 
+    def get_segment_index(self, threshold=0.7, method='texttiling', window=3):
+        """
+        returns the utterances of every transcript segment, see `get_segments`.
+
+        Paramters
+        ---------
+        threshold: float
+            sentence similarity threshold. (used to merge the sentences into coherant segments)
+
+        method: str, texttiling or embedding
+            how the initial segments are found.
+
+        window: int
+            number of utterances compared on each side of a candidate boundary when method is embedding.
+
+        Return
+        ------
+        segment_index: list
+            list of segments, each one a list of the row positions of its utterances.
+        """
+        _, boundaries, merge_index = self._segment(threshold, method, window)
+        bounds = boundaries + [len(self.data)]
+        return [list(range(bounds[i[0]], bounds[i[-1] + 1])) for i in merge_index]
+
+    def _segment(self, threshold, method, window):
+        utterances = self.data[self.utterance].tolist()
+        if method == 'texttiling':
+            segments, boundaries = self._text_tilling()
+        elif method == 'embedding':
+            boundaries = [0] + self._embedding_tilling(window)
+            segments = [' '.join(utterances[start:end]) for start, end in
+                        zip(boundaries, boundaries[1:] + [len(utterances)])]
+        else:
+            raise ValueError(
+                "Please pass method either as `texttiling` or `embedding`")
+
+        merge_index = self._merge_segments(segments, threshold)
+        return segments, boundaries, merge_index
+
     def _merge_segments(self, segments, threshold):
+        sims = self._get_similarities(segments)
         segment_map = [0]
-        for index, (text1, text2) in enumerate(zip(segments[:-1], segments[1:])):
-            sim = self._get_similarity(text1, text2)
+        for sim in sims:
             if sim >= threshold:
                 segment_map.append(0)
             else:
@@ -76,25 +123,104 @@ class SemanticTextSegmentation:
         index_list.append(temp)
         return index_list
 
-    def _get_similarity(self, text1, text2):
-        sentence_1 = [i.text.strip()
-                      for i in nlp(text1).sents if len(i.text.split(' ')) > 1]
-        sentence_2 = [i.text.strip()
-                      for i in nlp(text2).sents if len(i.text.split(' ')) > 2]
-        embeding_1 = model.encode(sentence_1)
-        embeding_2 = model.encode(sentence_2)
-        embeding_1 = np.mean(embeding_1, axis=0).reshape(1, -1)
-        embeding_2 = np.mean(embeding_2, axis=0).reshape(1, -1)
-        
-        if np.any(np.isnan(embeding_1)) or np.any(np.isnan(embeding_2)):
-            return 1
-        
-        sim = cosine_similarity(embeding_1, embeding_2)
-        return sim
+    def _get_similarities(self, segments):
+        """
+        Cosine similarity of every pair of adjacent segments.
+
+        All the sentences of the transcript are encoded in one batch, then every segment is
+        represented by the mean of its sentence embeddings: sentences longer than one word
+        when it is the first segment of a pair, longer than two words when it is the second one.
+        """
+        docs = self.doc_store.get_docs(segments)
+        sentences, owner, long_sentence = [], [], []
+        for index, doc in enumerate(docs):
+            for sent in doc.sents:
+                n_words = len(sent.text.split(' '))
+                if n_words > 1:
+                    sentences.append(sent.text.strip())
+                    owner.append(index)
+                    long_sentence.append(n_words > 2)
+
+        embedings = default_embedding_cache.encode(sentences).astype(np.float64)
+        owner = np.array(owner, dtype=int)
+        long_sentence = np.array(long_sentence, dtype=bool)
+        embeding_1 = self._mean_pool(embedings, owner, len(segments))
+        embeding_2 = self._mean_pool(embedings[long_sentence], owner[long_sentence], len(segments))
+        embeding_1, embeding_2 = embeding_1[:-1], embeding_2[1:]
+
+        norm = np.linalg.norm(embeding_1, axis=1) * np.linalg.norm(embeding_2, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sims = np.where(norm > 0, (embeding_1 * embeding_2).sum(axis=1) / norm, 0.0)
+        missing = np.isnan(embeding_1).any(axis=1) | np.isnan(embeding_2).any(axis=1)
+        sims[missing] = 1
+        return sims
+
+    def _mean_pool(self, embedings, owner, n_segments):
+        sums = np.zeros((n_segments, embedings.shape[1]))
+        np.add.at(sums, owner, embedings)
+        counts = np.bincount(owner, minlength=n_segments)[:, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return sums / counts
 
     def _text_tilling(self):
+        from nltk.tokenize.texttiling import TextTilingTokenizer
+
+        separator = '\n\n\t'
+        utterances = self.data[self.utterance].tolist()
         tt = TextTilingTokenizer(w=15, k=10)
-        text = '\n\n\t'.join(self.data[self.utterance].tolist())
+        text = separator.join(utterances)
         segment = tt.tokenize(text)
-        segment = [i.replace("\n\n\t", ' ') for i in segment]
-        return segment
+
+        # segments are consecutive slices of the joined text, map their start
+        # offsets back to the position of the utterance that starts them.
+        utterance_starts = np.cumsum([0] + [len(i) + len(separator) for i in utterances[:-1]])
+        segment_starts = np.cumsum([0] + [len(i) for i in segment[:-1]])
+        boundaries = np.searchsorted(utterance_starts, segment_starts, side='left').tolist()
+
+        segment = [i.replace(separator, ' ') for i in segment]
+        return segment, boundaries
+
+    def _embedding_tilling(self, window=3):
+        """
+        TextTiling over utterance embeddings.
+
+        For every gap between two utterances, the mean embeddings of the `window` utterances
+        before and after it are compared. Gaps whose similarity sits in a deep valley (depth score
+        above mean - std/2, as in TextTiling) and that are the deepest within `window` utterances
+        become boundaries.
+
+        Returns
+        -------
+        boundaries: list
+            positions of the utterances which start a new segment.
+        """
+        embedings = default_embedding_cache.encode(self.data[self.utterance].tolist()).astype(np.float64)
+        n = len(embedings)
+        if n < 2 * window:
+            return []
+
+        cum = np.vstack([np.zeros((1, embedings.shape[1])), np.cumsum(embedings, axis=0)])
+        gaps = np.arange(1, n)
+        left = cum[gaps] - cum[np.maximum(gaps - window, 0)]
+        right = cum[np.minimum(gaps + window, n)] - cum[gaps]
+        norm = np.linalg.norm(left, axis=1) * np.linalg.norm(right, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sims = np.where(norm > 0, (left * right).sum(axis=1) / norm, 0.0)
+
+        left_peak = self._sliding_max(sims, window, 0)
+        right_peak = self._sliding_max(sims, 0, window)
+        depth = left_peak + right_peak - 2 * sims
+
+        cutoff = depth.mean() - depth.std() / 2
+        is_peak = depth >= self._sliding_max(depth, window, window)
+        candidates = np.flatnonzero(is_peak & (depth > cutoff))
+
+        boundaries = []
+        for i in candidates:
+            if (not boundaries or i - boundaries[-1] >= window) and window <= i + 1 <= n - window:
+                boundaries.append(i)
+        return [int(i) + 1 for i in boundaries]
+
+    def _sliding_max(self, values, before, after):
+        padded = np.pad(values, (before, after), constant_values=-np.inf)
+        return np.lib.stride_tricks.sliding_window_view(padded, before + after + 1).max(axis=1)
@@ -1,11 +1,23 @@
 import attr
-import spacy
 import numpy as np
 import pandas as pd
 from collections import Counter
-from .utils import load_spacy
+from .doc_store import DocStore
 
-nlp = load_spacy()
+
+_tag_groups = dict(num_pronouns=["PRP", "PRP$", "WP", "WP$"], num_prp=["PRP"], num_articles=['DT'],
+                   num_past=['VBD', 'VBN'], num_future=['MD'], num_prep=['IN'])
+
+stats_columns = list(_tag_groups) + ['num_words', 'wps', 'num_negations']
+
+psychological_correlates = dict(
+    num_pronouns="Informal, personal", num_prp="Personal, social",
+    num_articles="Use of concrete nouns, interest in objects/things", num_past="Focused on the past",
+    num_future="Future and goal-oriented", num_prep="Education, concern with precision",
+    num_words="Talkativeness, verbal fluency", wps="Verbal fluency, cognitive complexity",
+    num_negations="Inhibition")
+
+correlate_labels = np.array([psychological_correlates[i] for i in stats_columns], dtype=object)
 
 
 @attr.s
@@ -24,14 +36,19 @@ class SpeakerStats:
     utterance: str
         pass the column name which represent utterance in transcript dataframe
 
-
+    doc_store: DocStore
+        store of parsed spacy documents, share one between analysers to parse the transcript only once.
 
     """
     data = attr.ib()
     speaker = attr.ib(default='speaker')
     utterance = attr.ib(default='utterance')
+    doc_store = attr.ib(default=None)
 
     def __attrs_post_init__(self):
+        if self.doc_store is None:
+            self.doc_store = DocStore()
+
         columns = self.data.columns.tolist()
 
         if self.speaker not in columns:
@@ -40,7 +57,7 @@ class SpeakerStats:
         if self.utterance not in columns:
             raise ValueError("Please pass proper speaker column")
 
-    def get_stats(self, n_topic=2):
+    def get_stats(self, n_topic=2, n_process=1, batch_size=256):
         """
         Returns Speaker stats 
 
@@ -49,14 +66,20 @@ class SpeakerStats:
         n_topic: int
             Define the maximum number of speaker stat you want to identify.
 
+        n_process: int
+            number of processes used to parse the utterances with spacy, -1 uses all the CPU cores.
+
+        batch_size: int
+            number of utterances sent to a spacy process at a time.
+
         Returns
         -------
         return_dict: dict
             Dictionary of user stats.
         """
 
-        self.data['speaker_stats'] = self.data[self.utterance].apply(
-            self.get_text_summary)
+        self.data['speaker_stats'] = self._get_summaries(
+            self.data[self.utterance].tolist(), n_process, batch_size)
         return_dict = {}
         for spk, df in self.data.groupby(by=self.speaker):
             df = df[~df.speaker_stats.isin([None, "Informal, personal"])]
@@ -65,106 +88,162 @@ class SpeakerStats:
             return_dict[spk] = _
         return return_dict
 
-    def _tag_stats(self, tagged_input):
-        num_pronouns = 0
-        num_prp = 0
-        num_articles = 0
-        num_past = 0
-        num_future = 0
-        num_prep = 0
-
-        for token in tagged_input:
-            tag = token.tag_
-            if tag in ["PRP", "PRP$", "WP", "WP$"]:
-                num_pronouns += 1
+    def get_speaker_profile(self, normalize=True, n_process=1, batch_size=256):
+        """
+        Returns the aggregated linguistic profile of every speaker.
 
-            if tag in ["PRP"]:
-                num_prp += 1
+        The stats of all the utterances are summed per speaker in one groupby, the input
+        dataframe is not modified.
 
-            if tag in ['DT']:
-                num_articles += 1
+        parameters
+        ----------
+        normalize: bool
+            divide the pronoun, article, tense, preposition and negation counts by the number of words of the speaker.
 
-            if tag in ['VBD', 'VBN']:
-                num_past += 1
+        n_process: int
+            number of processes used to parse the utterances with spacy, -1 uses all the CPU cores.
 
-            if tag in ['MD']:
-                num_future += 1
+        batch_size: int
+            number of utterances sent to a spacy process at a time.
 
-            if tag in ['IN']:
-                num_prep += 1
+        Returns
+        -------
+        profile: pd.DataFrame
+            one row per speaker with the number of utterances and words, the mean words per sentence
+            and the (normalized) counts of the other stats.
+        """
+        stats = self.get_lingustic_stats_frame(n_process, batch_size)
+        return self._get_profile(stats, self.data[self.speaker], normalize)
+
+    def _get_profile(self, stats, by, normalize=True):
+        grouped = stats.groupby(by, sort=False)
+        counts = [i for i in stats_columns if i not in ('num_words', 'wps')]
+
+        profile = grouped[['num_words'] + counts].sum()
+        if normalize:
+            words = profile['num_words'].where(profile['num_words'] > 0)
+            profile[counts] = profile[counts].div(words, axis=0).fillna(0.0)
+        profile.insert(0, 'num_utterances', grouped.size())
+        profile.insert(2, 'wps', grouped['wps'].mean().round(2))
+        return profile
+
+    def get_lingustic_stats_frame(self, n_process=1, batch_size=256):
+        """
+        Returns the linguistic stats of every utterance.
 
-        return_dict = dict(num_pronouns=num_pronouns, num_prp=num_prp, num_articles=num_articles,
-                           num_past=num_past, num_future=num_future, num_prep=num_prep)
-        return return_dict
+        parameters
+        ----------
+        n_process: int
+            number of processes used to parse the utterances with spacy, -1 uses all the CPU cores.
 
-    def _word_counter(self, text):
-        count = 0
-        for i in text:
-            if not i.is_punct:
-                count += 1
-        return count
+        batch_size: int
+            number of utterances sent to a spacy process at a time.
 
-    def _avg_words_per_sentence(self, text):
-        count_list = []
-        for i in text.sents:
-            c = self._word_counter(i)
-            count_list.append(c)
-        return round(np.mean(np.array(count_list)), 2)
+        Returns
+        -------
+        stats: pd.DataFrame
+            numeric dataframe with one row per utterance and one column per stat.
+        """
+        docs = self.doc_store.get_docs(self.data[self.utterance], n_process, batch_size)
+        return self._get_stats_frame(docs, self.data.index)
 
-    def _count_negation(self, text):
-        temp = [tok for tok in text if tok.dep_ == 'neg']
-        return len(temp)
+    def _get_stats_frame(self, docs, index=None):
+        """
+        Computes the stats of all the docs in one vectorized pass over their token arrays.
+        """
+        from spacy.attrs import TAG, IS_PUNCT, DEP, SENT_START
+
+        n_docs = len(docs)
+        lengths = np.array([len(doc) for doc in docs], dtype=int)
+        arrays = [doc.to_array([TAG, IS_PUNCT, DEP, SENT_START]) for doc in docs if len(doc)]
+        tokens = np.concatenate(arrays) if arrays else np.zeros((0, 4), dtype=np.uint64)
+        tags, is_word, deps = tokens[:, 0], tokens[:, 1] == 0, tokens[:, 2]
+        doc_ids = np.repeat(np.arange(n_docs), lengths)
+
+        stats = {}
+        # token counts per (doc, tag), then summed over the tags of every stat
+        tag_values, tag_codes = np.unique(tags, return_inverse=True)
+        tag_counts = np.bincount(doc_ids * len(tag_values) + tag_codes.reshape(-1),
+                                 minlength=n_docs * len(tag_values)).reshape(n_docs, len(tag_values))
+        for name, tag_names in _tag_groups.items():
+            hashes = [docs[0].vocab.strings[i] for i in tag_names] if n_docs else []
+            stats[name] = tag_counts[:, np.isin(tag_values, hashes)].sum(axis=1)
+
+        stats['num_words'] = np.bincount(doc_ids, weights=is_word, minlength=n_docs).astype(int)
+
+        # the first token of a doc always starts a sentence, as in Doc.sents
+        sent_starts = tokens[:, 3].astype(np.int64) == 1
+        sent_starts[np.cumsum(lengths)[lengths > 0] - lengths[lengths > 0]] = True
+        sent_ids = np.cumsum(sent_starts) - 1
+        words_per_sent = np.bincount(sent_ids, weights=is_word, minlength=sent_starts.sum())
+        sent_docs = doc_ids[sent_starts]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            wps = (np.bincount(sent_docs, weights=words_per_sent, minlength=n_docs) /
+                   np.bincount(sent_docs, minlength=n_docs))
+        stats['wps'] = np.round(wps, 2)
+
+        neg = docs[0].vocab.strings['neg'] if n_docs else 0
+        stats['num_negations'] = np.bincount(doc_ids, weights=deps == neg, minlength=n_docs).astype(int)
+        return pd.DataFrame(stats, index=index, columns=stats_columns)
 
     def get_lingustic_stats(self, text):
-        text = nlp(text)
-        stats = self._tag_stats(text)
-        stats['num_words'] = self._word_counter(text)
-        stats['wps'] = self._avg_words_per_sentence(text)
-        stats['num_negations'] = self._count_negation(text)
-        return stats
+        return self._get_doc_stats(self.doc_store.get(text))
+
+    def _get_doc_stats(self, text):
+        stats = self._get_stats_frame([text])
+        return {k: stats[k].iloc[0].item() for k in stats_columns}
 
     def get_text_summary(self, text):
-        t = self.get_lingustic_stats(text)
-        temp = self._get_correlation(t)
-        if len(temp):
-            temp = temp[0]
-        else:
-            temp = None
-        return temp
+        return self._get_doc_summary(self.doc_store.get(text))
+
+    def _get_summaries(self, texts, n_process=1, batch_size=256):
+        docs = self.doc_store.get_docs(texts, n_process, batch_size)
+        return self._get_top_correlates(self._get_stats_frame(docs)).tolist()
+
+    def _get_doc_summary(self, doc):
+        return self._get_top_correlates(self._get_stats_frame([doc]))[0]
+
+    def _get_top_correlates(self, stats, num_words_threshold=100, wps_threshold=20):
+        """
+        Returns the first informative correlate of every row of the stats frame, None if it has none.
+        """
+        candidates, valid = self._rank_correlates(stats, num_words_threshold, wps_threshold)
+        first = candidates[np.arange(len(candidates)), valid.argmax(axis=1)]
+        return np.where(valid.any(axis=1), correlate_labels[first], None)
+
+    def _rank_correlates(self, stats, num_words_threshold=100, wps_threshold=20):
+        """
+        Ranks the correlates of all the rows of the stats frame at once.
+
+        The num_words and wps correlates come first when above their threshold, then the other
+        stats by decreasing count, ties in the order of `stats_columns`. Zero counts are dropped.
+
+        Returns
+        -------
+        candidates: np.ndarray
+            (rows, correlates) positions in `stats_columns` of the ranked correlates.
+
+        valid: np.ndarray
+            (rows, correlates) mask of the candidates that are informative.
+        """
+        values = stats[stats_columns].to_numpy(dtype=float)
+        words, wps, prep, pronouns = (stats_columns.index(i) for i in
+                                      ('num_words', 'wps', 'num_prep', 'num_pronouns'))
+        counts = np.array([i for i in range(len(stats_columns)) if i not in (words, wps)])
+
+        order = counts[np.argsort(-values[:, counts], axis=1, kind='stable')]
+        n_rows = len(values)
+        candidates = np.hstack([np.full((n_rows, 1), words), np.full((n_rows, 1), wps), order])
+        valid = np.hstack([values[:, [words]] > num_words_threshold, values[:, [wps]] > wps_threshold,
+                           np.take_along_axis(values, order, axis=1) > 0])
+
+        # a preposition count equal to the pronoun one, ranked third, is read as informal speech
+        rank = np.cumsum(valid, axis=1) - 1
+        informal = (valid & (candidates == prep) & (rank == 2) &
+                    (values[:, [prep]] == values[:, [pronouns]]))
+        candidates[informal] = pronouns
+        return candidates, valid
 
     def _get_correlation(self, data, num_words_threshold=100, wps_threshold=20):
-        informative_correlates = []
-        psychological_correlates = {}
-        psychological_correlates["num_words"] = "Talkativeness, verbal fluency"
-        psychological_correlates["wps"] = "Verbal fluency, cognitive complexity"
-        psychological_correlates["num_pronouns"] = "Informal, personal"
-        psychological_correlates["num_prp"] = "Personal, social"
-        psychological_correlates["num_articles"] = "Use of concrete nouns, interest in objects/things"
-        psychological_correlates["num_past"] = "Focused on the past"
-        psychological_correlates["num_future"] = "Future and goal-oriented"
-        psychological_correlates["num_prep"] = "Education, concern with precision"
-        psychological_correlates["num_negations"] = "Inhibition"
-        # Set thresholds
-        if data['num_words'] > num_words_threshold:
-            informative_correlates.append(
-                psychological_correlates['num_words'])
-
-        if data['wps'] > wps_threshold:
-            informative_correlates.append(psychological_correlates['wps'])
-
-        d = dict(sorted(data.items(), key=lambda x: x[1], reverse=True))
-
-        all_visited = False
-        while(len(informative_correlates) < 3):
-            for index, (i, j) in enumerate(d.items()):
-                if j == 0:
-                    continue
-                if i == 'num_prep' and d['num_pronouns'] == d['num_prep'] and len(informative_correlates) == 2:
-                    informative_correlates.append(
-                        psychological_correlates['num_pronouns'])
-                elif i not in ['num_words', 'wps']:
-                    informative_correlates.append(psychological_correlates[i])
-            if index+1 == len(d):
-                break
-
-        return informative_correlates
+        candidates, valid = self._rank_correlates(pd.DataFrame([data]), num_words_threshold, wps_threshold)
+        return correlate_labels[candidates[0][valid[0]]].tolist()
@@ -0,0 +1,195 @@
+import attr
+import pandas as pd
+from collections import Counter
+from .backchannel import default_matcher
+from .insights import Callyzer, emotion_labels
+from .doc_store import DocStore
+
+
+@attr.s
+class StreamingCallyzer:
+
+    """
+    Incremental version of `Callyzer` for live calls.
+
+    Utterances are added one at a time with `append` as they arrive from ASR. Turn ids,
+    silence/interruption events, backchannel and question flags and the per-speaker counters
+    are updated from the new utterance only, so the cost of each append does not grow with
+    the length of the call.
+
+    Paramters
+    ---------
+    speaker: str
+        name of the speaker name/id field of the appended utterances
+
+    utterance: str
+        name of the utterance field of the appended utterances
+
+    startime: str
+        name of the start time field of the appended utterances
+
+    endtime: str
+         name of the end time field of the appended utterances
+
+    silence_threshold: int
+        Minimun non-talk seconds between two users to consider as silence.
+
+    interruption_threshold: int
+        Minimun overlap seconds between two users to consider as interrptions.
+
+    tag_questions: bool
+        tag if the new utterances are questions (parses them with spacy).
+
+    tag_emotion: bool
+        tag the emotion of the new utterances (runs the zero-shot model).
+
+    emotion_backend: str, nli or embedding
+        labeling backend used to tag the emotions, see `Callyzer.tag_emotion`.
+
+    backchannel_matcher: BackchannelMatcher
+        dictionary matcher used to flag backchannels, the built-in lexicon by default.
+
+    Example
+    -------
+    >>> stream = StreamingCallyzer()
+    >>> stream.append({'speaker': 'agent', 'utterance': 'How can I help you?', 'startTime': 0.0, 'endTime': 1.2})
+    {'turn_id': 0, 'gap': None, 'event': None, 'is_backchannel': False, 'is_question': True}
+    """
+
+    utterance = attr.ib(default='utterance')
+    speaker = attr.ib(default='speaker')
+    starttime = attr.ib(default='startTime')
+    endtime = attr.ib(default='endTime')
+    silence_threshold = attr.ib(default=1)
+    interruption_threshold = attr.ib(default=1)
+    tag_questions = attr.ib(default=True)
+    tag_emotion = attr.ib(default=False)
+    emotion_backend = attr.ib(default='nli')
+    doc_store = attr.ib(default=None)
+    backchannel_matcher = attr.ib(default=default_matcher)
+    _rows = attr.ib(factory=list, init=False, repr=False)
+    _events = attr.ib(factory=list, init=False, repr=False)
+    _counters = attr.ib(factory=dict, init=False, repr=False)
+    _turn_id = attr.ib(default=-1, init=False, repr=False)
+    _last_speaker = attr.ib(default=None, init=False, repr=False)
+    _last_end = attr.ib(default=None, init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        if self.doc_store is None:
+            self.doc_store = DocStore()
+        # stateless helpers (question detection, zero-shot tagging) are shared with Callyzer
+        self._callyzer = Callyzer(pd.DataFrame(columns=[self.utterance, self.speaker, self.starttime, self.endtime]),
+                                  self.utterance, self.speaker, self.starttime, self.endtime, self.doc_store)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def append(self, utterance_row):
+        """
+        Add the next utterance of the call and tag it.
+
+        Parameters
+        ----------
+        utterance_row: dict or pd.Series
+            the utterance, with the speaker, utterance, start time and end time fields.
+
+        Returns
+        -------
+        features: dict
+            turn id, gap to the previous utterance, silence/interruption event and tags of the utterance.
+        """
+        row = dict(utterance_row)
+        index = len(self._rows)
+        speaker, text = row[self.speaker], row[self.utterance]
+        start, end = row[self.starttime], row[self.endtime]
+
+        if speaker != self._last_speaker:
+            self._turn_id += 1
+        self._last_speaker = speaker
+
+        counter = self._counters.setdefault(speaker, Counter())
+        counter['utterances'] += 1
+        counter['words'] += len(text.split())
+        counter['talk_time'] += end - start
+
+        gap, event = None, None
+        if self._last_end is not None:
+            gap = start - self._last_end
+            if gap >= self.silence_threshold:
+                event = 'silence'
+            elif -gap >= self.interruption_threshold:
+                event = 'interruption'
+        self._last_end = end
+
+        if event is not None:
+            counter[event] += 1
+            self._events.append(dict(speaker=speaker, start_time=start, end_time=end,
+                                     index=index, gap=gap, event=event))
+
+        features = dict(turn_id=self._turn_id, gap=gap, event=event,
+                        is_backchannel=self.backchannel_matcher.is_backchannel(text))
+        counter['backchannels'] += features['is_backchannel']
+
+        if self.tag_questions:
+            features['is_question'] = self._callyzer._is_text_question(text)
+            counter['questions'] += features['is_question']
+
+        if self.tag_emotion:
+            features['emotion'] = self._callyzer._classifier([text], emotion_labels,
+                                                             backend=self.emotion_backend)[0]
+
+        row.update(features)
+        self._rows.append(row)
+        return features
+
+    def to_frame(self):
+        """
+        Returns the utterances received so far with their tags.
+        """
+        return pd.DataFrame(self._rows)
+
+    def get_gap_events(self):
+        """
+        Returns the silence and interruption events so far, see `Callyzer.get_gap_events`.
+        """
+        return pd.DataFrame(self._events, columns=['speaker', 'start_time', 'end_time', 'index', 'gap', 'event'])
+
+    def get_silence(self):
+        """
+        Returns the speaker wise silences so far, in the format of `Callyzer.get_silence`.
+        """
+        return self._get_channel_details('silence')
+
+    def get_interruption(self):
+        """
+        Returns the speaker wise interruptions so far, in the format of `Callyzer.get_interruption`.
+        """
+        return self._get_channel_details('interruption')
+
+    def _get_channel_details(self, event):
+        return_dict = {k: dict(metadata=[], count=0) for k in self._counters}
+        total = 0
+        for i in self._events:
+            if i['event'] == event:
+                update_data = return_dict[i['speaker']]
+                update_data['metadata'].append(dict(start_time=i['start_time'], end_time=i['end_time'],
+                                                    index=i['index']))
+                update_data['count'] += 1
+                total += 1
+        return_dict['total_interruption'] = total
+        return return_dict
+
+    def get_speaker_counts(self):
+        """
+        Returns the running counters of every speaker.
+
+        Returns
+        -------
+        counts: pd.DataFrame
+            one row per speaker with the number of utterances, words, backchannels, questions,
+            silences and interruptions and the talk time.
+        """
+        columns = ['utterances', 'words', 'talk_time', 'backchannels', 'questions', 'silence', 'interruption']
+        counts = pd.DataFrame.from_dict({k: dict(v) for k, v in self._counters.items()},
+                                        orient='index', columns=columns)
+        return counts.fillna(0)
@@ -1,4 +1,5 @@
 import attr
+import numpy as np
 from .utils import load_summarization_model
 from .segmentation import SemanticTextSegmentation
 from tqdm import tqdm
@@ -24,6 +25,9 @@ class TranscriptSummarization:
     similarity_threshold: float
         pass the float value between 0 to 1
 
+    segmentation_method: str, texttiling or embedding
+        method used to find the transcript segments, see `SemanticTextSegmentation.get_segments`.
+
     """
 
     data = attr.ib()
@@ -32,52 +36,147 @@ class TranscriptSummarization:
     similarity_threshold = attr.ib(default=0.65)
     _summary_model = attr.ib(default=None)
     _segments = attr.ib(default=[])
+    segmentation_method = attr.ib(default='texttiling')
 
     def __attrs_post_init__(self):
         self.data[self.speaker] = self.data[self.speaker].astype(str)
-        self._summary_model = load_summarization_model()
 
     def _create_segments(self):
         tt = SemanticTextSegmentation(self.data, self.utterance)
-        self._segments = tt.get_segments(self.similarity_threshold)
-
-        segment_index = 0
-        segment_idx = []
-        for index, row in self.data.iterrows():
-            if row[self.utterance] in self._segments[segment_index]:
-                segment_idx.append(segment_index)
-            elif row[self.utterance] in self._segments[segment_index+1]:
-                segment_index += 1
-                segment_idx.append(segment_index)
-        self.data["segment_idx"] = segment_idx
+        self._segments = tt.get_segment_index(
+            self.similarity_threshold, self.segmentation_method)
+
+        sizes = [len(i) for i in self._segments]
+        self.data["segment_idx"] = np.repeat(np.arange(len(sizes)), sizes)
         return
 
-    def _get_segment_summary(self, segments):
+    def _get_segment_text(self, segments):
         conv = segments[self.speaker] + " : "+segments[self.utterance]
         text = "\n".join(conv.tolist())
 
         if len(segments) < 5 and len(text.split(' ')) < 150:
+            return None
+        return text
+
+    def _get_segment_summary(self, segments):
+        text = self._get_segment_text(segments)
+        if text is None:
             return ""
+        return self._summarize([text])[0]
 
-        try:
-            summary = self._summary_model(text)
-        except:
-            max_len = int(len(text)/3)
-            summary = self._summary_model(text[:max_len])
+    def get_summary(self, batch_size=8, max_batch_tokens=8192):
+        """
+        Return the transcript summary.
 
-        return summary[0]["summary_text"]
+        Parameters
+        ----------
+        batch_size: int
+            maximum number of segments (or segment chunks) summarized per model call.
+
+        max_batch_tokens: int
+            maximum number of input tokens in a batch, counting padding.
 
-    def get_summary(self):
         """
-        Return the transcript summary.
+        if self._summary_model is None:
+            self._summary_model = load_summarization_model()
+        texts = self._get_segment_texts()
+        summaries = self._summarize([i for i in texts if i is not None], batch_size, max_batch_tokens)
+        return self._join_summaries(texts, summaries)
 
+    def _get_segment_texts(self):
+        """
+        Returns the text of every segment, None for the segments too short to summarize.
         """
         self._create_segments()
-        summary = ""
-        for i, sgmt in tqdm(self.data.groupby("segment_idx")):
-            try:
-                summary += self._get_segment_summary(sgmt)
-            except:
-                continue
+        return [self._get_segment_text(sgmt)
+                for i, sgmt in self.data.groupby("segment_idx")]
 
+    def _join_summaries(self, texts, summaries):
+        # summaries of the texts that are not None, in order
+        summaries = iter(summaries)
+        summary = ""
+        for text in texts:
+            if text is not None:
+                summary += next(summaries)
         return summary
+
+    def _max_input_length(self):
+        tokenizer, model = self._summary_model.tokenizer, self._summary_model.model
+        max_length = getattr(model.config, 'max_position_embeddings', None) or tokenizer.model_max_length
+        return min(max_length, tokenizer.model_max_length)
+
+    def _summarize(self, texts, batch_size=8, max_batch_tokens=8192):
+        """
+        Summarize texts in token-budgeted batches.
+
+        Texts are tokenized once, with the model prefix as in the summarization pipeline.
+        Texts longer than the model input are split into chunks at token boundaries. The chunk
+        summaries are joined and summarized again until they fit in one input.
+        """
+        if not texts:
+            return []
+
+        tokenizer, model = self._summary_model.tokenizer, self._summary_model.model
+        chunk_length = self._max_input_length() - tokenizer.num_special_tokens_to_add()
+        # the summarization pipeline prepends the model prefix (e.g. "summarize: ") to its input,
+        # chunks after the first of a long text get it too
+        prefix = getattr(model.config, 'prefix', None) or ''
+        prefix_ids = tokenizer(prefix, add_special_tokens=False)['input_ids'] if prefix else []
+        input_ids = tokenizer([prefix + i for i in texts], add_special_tokens=False)['input_ids']
+
+        chunks, owner = [], []
+        for index, ids in enumerate(input_ids):
+            chunks.append(ids[:chunk_length])
+            owner.append(index)
+            step = max(chunk_length - len(prefix_ids), 1)
+            for start in range(chunk_length, len(ids), step):
+                chunks.append(prefix_ids + ids[start:start + step])
+                owner.append(index)
+
+        chunk_summaries = self._generate(chunks, batch_size, max_batch_tokens)
+        parts = [[] for _ in texts]
+        for index, summary in zip(owner, chunk_summaries):
+            parts[index].append(summary)
+
+        summaries = [i[0] if len(i) == 1 else None for i in parts]
+        pending = [index for index, i in enumerate(parts) if len(i) > 1]
+        if pending:
+            joined = [' '.join(parts[i]) for i in pending]
+            shorter = [len(j) < len(texts[i]) for i, j in zip(pending, joined)]
+            merged = self._summarize([j for j, ok in zip(joined, shorter) if ok],
+                                     batch_size, max_batch_tokens)
+            merged = iter(merged)
+            for i, j, ok in zip(pending, joined, shorter):
+                summaries[i] = next(merged) if ok else j
+        return summaries
+
+    def _generate(self, chunks, batch_size, max_batch_tokens):
+        import torch
+
+        tokenizer, model = self._summary_model.tokenizer, self._summary_model.model
+        inputs = [tokenizer.build_inputs_with_special_tokens(i) for i in chunks]
+
+        # longest first, a batch grows while its padded size fits the token budget
+        order = sorted(range(len(inputs)), key=lambda i: len(inputs[i]), reverse=True)
+        batches, batch = [], []
+        for index in order:
+            padded_length = len(inputs[batch[0]]) if batch else len(inputs[index])
+            if batch and (len(batch) >= batch_size or (len(batch) + 1) * padded_length > max_batch_tokens):
+                batches.append(batch)
+                batch = []
+            batch.append(index)
+        if batch:
+            batches.append(batch)
+
+        summaries = [None] * len(inputs)
+        for batch in tqdm(batches):
+            features = tokenizer.pad({'input_ids': [inputs[i] for i in batch]}, return_tensors='pt')
+            features = {k: v.to(self._summary_model.device) for k, v in features.items()}
+            with torch.no_grad():
+                output = model.generate(**features)
+            # decoded as the summarization pipeline does
+            decoded = tokenizer.batch_decode(output, skip_special_tokens=True,
+                                             clean_up_tokenization_spaces=False)
+            for index, text in zip(batch, decoded):
+                summaries[index] = text
+        return summaries
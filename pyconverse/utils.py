@@ -1,39 +1,436 @@
+import os
 import re
 import json
-import spacy
+import shutil
 import string
+import logging
+import contextlib
+import attr
 import numpy as np
-from functools import lru_cache
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-from transformers import pipeline
+from .registry import model_registry
 
+logger = logging.getLogger(__name__)
 
-@lru_cache
-def load_sentence_transformer(model_name='all-MiniLM-L6-v2'):
-    model = SentenceTransformer(model_name)
-    return model
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 
-@lru_cache
-def load_spacy():
-    return spacy.load('en_core_web_sm')
+@contextlib.contextmanager
+def _locked(path):
+    # exclusive lock of a file between processes, where fcntl is available
+    with open(path, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
 
 
-def load_zeroshot_model(model_name="facebook/bart-large-mnli"):
-    classifier = pipeline("zero-shot-classification", model=model_name)
-    return classifier
+# Heavy libraries (spacy, transformers, sentence-transformers, optimum) are imported
+# inside the loaders so `import pyconverse` stays cheap. Models are loaded the
+# first time a feature needs them and kept in the shared `model_registry`.
 
+def _dtype_name(dtype):
+    return None if dtype is None else str(dtype).replace('torch.', '')
 
-def load_summarization_model(model="knkarthick/MEETING_SUMMARY"):
-    model = pipeline("summarization", model=model)
-    return model
+
+def _to_dtype(module, dtype):
+    if dtype is not None:
+        import torch
+        module.to(getattr(torch, dtype))
+    return module
+
+
+_inference_options = dict(backend='torch', quantize=True, threads=None,
+                          cache_dir=os.path.join(os.path.expanduser('~'), '.cache', 'pyconverse', 'onnx'))
+
+
+def set_inference_backend(backend='torch', quantize=True, threads=None, cache_dir=None):
+    """
+    Choose how the transformer models (zero-shot, summarization, sentence-transformer) run.
+
+    The setting applies to every model loaded afterwards, so it is picked up by all the
+    analysers. `onnx` exports the models to ONNX once, with optimum, and runs them with
+    ONNX Runtime on CPU. The exported (and quantized) models are kept in `cache_dir`.
+    It needs the onnx extra, `pip install pyconverse[onnx]`, ImportError is raised here
+    when optimum, onnxruntime or transformers are missing or of an unsupported version.
+
+    Parameters
+    ----------
+    backend: str, torch or onnx
+        inference backend.
+
+    quantize: bool
+        apply dynamic int8 quantization to the ONNX models.
+
+    threads: int
+        number of intra-op threads of the ONNX Runtime sessions, ONNX Runtime default if None.
+
+    cache_dir: str
+        directory of the exported ONNX models, ~/.cache/pyconverse/onnx by default.
+
+    Example
+    -------
+    >>> from pyconverse import set_inference_backend, Callyzer
+    >>> set_inference_backend('onnx', quantize=True, threads=4)
+    >>> Callyzer(data).tag_emotion()
+    """
+    if backend not in ('torch', 'onnx'):
+        raise ValueError("Please pass backend either as `torch` or `onnx`")
+    if backend == 'onnx':
+        _import_optimum()
+    _inference_options.update(backend=backend, quantize=quantize, threads=threads)
+    if cache_dir is not None:
+        _inference_options['cache_dir'] = cache_dir
+
+
+def backend_name(backend=None):
+    """
+    Returns the name of the backend models are loaded with, `torch`, `onnx` or `onnx-int8`.
+    """
+    backend = backend or _inference_options['backend']
+    if backend not in ('torch', 'onnx'):
+        raise ValueError("Please pass backend either as `torch` or `onnx`")
+    if backend == 'onnx' and _inference_options['quantize']:
+        return 'onnx-int8'
+    return backend
+
+
+# versions of the onnx extra (`pip install pyconverse[onnx]`) the export and load path works with,
+# optimum needs a newer transformers than the torch backend does
+_onnx_versions = dict(transformers=((4, 26), (4, 36)), optimum=((1, 8), (1, 14)))
+
+
+def _package_version(name):
+    from importlib.metadata import version
+    return tuple(int(i) for i in re.findall(r'\d+', version(name))[:2])
+
+
+def _import_optimum():
+    try:
+        import optimum.onnxruntime
+        import onnxruntime
+    except ImportError:
+        raise ImportError("The onnx backend needs optimum and onnxruntime, "
+                          "install them with `pip install pyconverse[onnx]`")
+    for name, (minimum, maximum) in _onnx_versions.items():
+        if not minimum <= _package_version(name) < maximum:
+            raise ImportError("The onnx backend needs {}>={},<{}, install it with `pip install pyconverse[onnx]`"
+                              .format(name, '.'.join(map(str, minimum)), '.'.join(map(str, maximum))))
+    return optimum.onnxruntime
+
+
+def _onnx_session_options():
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    if _inference_options['threads']:
+        options.intra_op_num_threads = _inference_options['threads']
+    return options
+
+
+def _export_onnx(model_class, model_name):
+    """
+    Export the model and its tokenizer to the ONNX cache once, and quantize it when enabled.
+
+    Returns the export directory and the names of the ONNX files to load.
+    """
+    from transformers import AutoTokenizer
+
+    directory = os.path.join(_inference_options['cache_dir'], model_name.replace('/', '__'))
+    if not os.path.exists(os.path.join(directory, 'config.json')):
+        model_class.from_pretrained(model_name, export=True).save_pretrained(directory)
+        AutoTokenizer.from_pretrained(model_name).save_pretrained(directory)
+
+    files = sorted(i for i in os.listdir(directory) if i.endswith('.onnx') and not i.endswith('_int8.onnx'))
+    if _inference_options['quantize']:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        for name in files:
+            output = os.path.join(directory, name.replace('.onnx', '_int8.onnx'))
+            if not os.path.exists(output):
+                quantize_dynamic(os.path.join(directory, name), output, weight_type=QuantType.QInt8)
+        files = [i.replace('.onnx', '_int8.onnx') for i in files]
+    return directory, files
+
+
+def _load_onnx(model_class, model_name, **file_names):
+    # file_names maps the from_pretrained argument of every ONNX file to its exported name prefix
+    directory, files = _export_onnx(model_class, model_name)
+    kwargs = {}
+    for argument, prefix in file_names.items():
+        matches = [i for i in files if i.startswith(prefix + '.') or i.startswith(prefix + '_int8.')]
+        if matches:
+            kwargs[argument] = matches[0]
+    model = model_class.from_pretrained(directory, session_options=_onnx_session_options(),
+                                        provider='CPUExecutionProvider', **kwargs)
+    return directory, model
+
+
+@attr.s
+class OnnxSentenceEncoder:
+    """
+    ONNX Runtime version of a sentence-transformer, with the same `encode` interface.
+
+    `pooling` is `mean`, `cls` or `max`, as set in the pooling config of the sentence-transformer.
+    """
+
+    tokenizer = attr.ib()
+    model = attr.ib()
+    max_seq_length = attr.ib(default=256)
+    normalize = attr.ib(default=True)
+    pooling = attr.ib(default='mean')
+
+    def __attrs_post_init__(self):
+        if self.pooling not in ('mean', 'cls', 'max'):
+            raise ValueError("Please pass pooling either as `mean`, `cls` or `max`")
+
+    def _pool(self, hidden, attention_mask):
+        mask = attention_mask[..., None].astype(hidden.dtype)
+        if self.pooling == 'cls':
+            return hidden[:, 0]
+        if self.pooling == 'max':
+            return np.where(mask > 0, hidden, -1e9).max(axis=1)
+        return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        embeddings = []
+        for start in range(0, len(sentences), batch_size):
+            inputs = self.tokenizer(list(sentences[start:start + batch_size]), padding=True, truncation=True,
+                                    max_length=self.max_seq_length, return_tensors='np')
+            hidden = np.asarray(self.model(**inputs).last_hidden_state)
+            vectors = self._pool(hidden, inputs['attention_mask'])
+            if self.normalize:
+                vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            embeddings.append(vectors.astype(np.float32))
+        if not embeddings:
+            return np.empty((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+        return np.concatenate(embeddings)
+
+    def get_sentence_embedding_dimension(self):
+        return self.model.config.hidden_size
+
+
+def _sentence_transformer_file(model_name, directory, file_name):
+    """
+    Returns the parsed json file of a sentence-transformer, None if the model does not ship it.
+
+    The file is read from the export directory, then from the model directory when the model is
+    local, else downloaded from the hub. It is copied to the export directory so the next loads
+    do not go to the hub.
+    """
+    path = os.path.join(directory, file_name)
+    if not os.path.exists(path):
+        if os.path.isdir(model_name):
+            source = os.path.join(model_name, file_name)
+            if not os.path.exists(source):
+                return None
+        else:
+            from huggingface_hub import hf_hub_download
+            from huggingface_hub.utils import EntryNotFoundError
+            try:
+                source = hf_hub_download(model_name, file_name)
+            except EntryNotFoundError:
+                return None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(source, path)
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _sentence_transformer_config(model_name, directory):
+    """
+    Returns the max_seq_length, normalize and pooling settings of a sentence-transformer.
+
+    Settings the model does not ship fall back to the defaults of all-MiniLM-L6-v2, with a warning.
+    """
+    config = dict(max_seq_length=256, normalize=True, pooling='mean')
+
+    bert_config = _sentence_transformer_file(model_name, directory, 'sentence_bert_config.json')
+    if bert_config is None:
+        logger.warning("%s has no sentence_bert_config.json, using max_seq_length=256", model_name)
+    else:
+        config['max_seq_length'] = bert_config.get('max_seq_length', 256)
+
+    modules = _sentence_transformer_file(model_name, directory, 'modules.json')
+    if modules is None:
+        logger.warning("%s has no modules.json, using mean pooling and normalized embeddings", model_name)
+        return config
+    config['normalize'] = any(i['type'].endswith('Normalize') for i in modules)
+
+    pooling = [i for i in modules if i['type'].endswith('Pooling')]
+    pooling = pooling and _sentence_transformer_file(
+        model_name, directory, pooling[0]['path'] + '/config.json')
+    if not pooling:
+        logger.warning("%s has no pooling config, using mean pooling", model_name)
+    elif pooling.get('pooling_mode_cls_token'):
+        config['pooling'] = 'cls'
+    elif pooling.get('pooling_mode_max_tokens'):
+        config['pooling'] = 'max'
+    return config
+
+
+def _onnx_sentence_encoder(model_name):
+    ort = _import_optimum()
+    from transformers import AutoTokenizer
+
+    if '/' not in model_name and not os.path.isdir(model_name):
+        model_name = 'sentence-transformers/' + model_name
+    directory, model = _load_onnx(ort.ORTModelForFeatureExtraction, model_name, file_name='model')
+    config = _sentence_transformer_config(model_name, directory)
+    return OnnxSentenceEncoder(AutoTokenizer.from_pretrained(directory), model, **config)
+
+
+def load_sentence_transformer(model_name='all-MiniLM-L6-v2', device=None, dtype=None, backend=None):
+    dtype = _dtype_name(dtype)
+    backend = backend_name(backend)
+
+    def loader():
+        if backend != 'torch':
+            return _onnx_sentence_encoder(model_name)
+        from sentence_transformers import SentenceTransformer
+        return _to_dtype(SentenceTransformer(model_name, device=device), dtype)
+
+    return model_registry.get('sentence-similarity', model_name, loader, device, dtype, backend)
+
+
+def load_spacy(model_name='en_core_web_sm'):
+    def loader():
+        import spacy
+        return spacy.load(model_name)
+
+    return model_registry.get('spacy', model_name, loader)
+
+
+def load_zeroshot_model(model_name="facebook/bart-large-mnli", device=-1, dtype=None, backend=None):
+    dtype = _dtype_name(dtype)
+    backend = backend_name(backend)
+
+    def loader():
+        if backend != 'torch':
+            ort = _import_optimum()
+            from transformers import AutoTokenizer
+            from optimum.pipelines import pipeline as ort_pipeline
+            directory, model = _load_onnx(ort.ORTModelForSequenceClassification, model_name, file_name='model')
+            return ort_pipeline("zero-shot-classification", model=model,
+                                tokenizer=AutoTokenizer.from_pretrained(directory), accelerator='ort')
+
+        from transformers import pipeline
+        classifier = pipeline("zero-shot-classification",
+                              model=model_name, device=device)
+        _to_dtype(classifier.model, dtype)
+        return classifier
+
+    return model_registry.get('zero-shot-classification', model_name, loader, device, dtype, backend)
+
+
+def load_summarization_model(model="knkarthick/MEETING_SUMMARY", device=-1, dtype=None, backend=None):
+    dtype = _dtype_name(dtype)
+    backend = backend_name(backend)
+
+    def loader():
+        if backend != 'torch':
+            ort = _import_optimum()
+            from transformers import AutoTokenizer
+            from optimum.pipelines import pipeline as ort_pipeline
+            directory, seq2seq = _load_onnx(ort.ORTModelForSeq2SeqLM, model,
+                                            encoder_file_name='encoder_model',
+                                            decoder_file_name='decoder_model',
+                                            decoder_with_past_file_name='decoder_with_past_model')
+            return ort_pipeline("summarization", model=seq2seq,
+                                tokenizer=AutoTokenizer.from_pretrained(directory), accelerator='ort')
+
+        from transformers import pipeline
+        summarizer = pipeline("summarization", model=model, device=device)
+        _to_dtype(summarizer.model, dtype)
+        return summarizer
+
+    return model_registry.get('summarization', model, loader, device, dtype, backend)
+
+
+def parse_texts(texts, n_process=1, batch_size=256):
+    """
+    Parse texts with the shared spaCy pipeline using `nlp.pipe`.
+
+    Parameters
+    ----------
+    texts: list
+        list of texts to parse.
+
+    n_process: int
+        number of processes used for parsing, -1 uses all the CPU cores.
+
+    batch_size: int
+        number of texts sent to a process at a time.
+
+    Returns
+    -------
+    docs: list
+        list of spacy Doc, in the same order as texts.
+    """
+    nlp = load_spacy()
+    return list(nlp.pipe(texts, n_process=n_process, batch_size=batch_size))
+
+
+def _build_hypernym_index():
+    from .hypernym_index import default_hypernym_index
+    return default_hypernym_index.ensure_built()
+
+
+_warmup_loaders = {
+    'spacy': load_spacy,
+    'sentence_transformer': load_sentence_transformer,
+    'zeroshot': load_zeroshot_model,
+    'summarization': load_summarization_model,
+    'hypernyms': _build_hypernym_index,
+}
+
+
+def warmup(models=None, hypernym_index_path=False):
+    """
+    Eagerly load the models used by pyconverse.
+
+    Models are otherwise loaded lazily on first use. Call this at service
+    start-up to pay the loading cost before the first request.
+
+    Parameters
+    ----------
+    models: list
+        names of the models to load, any of ['spacy', 'sentence_transformer', 'zeroshot', 'summarization',
+        'hypernyms'] (the keyword hypernym index, built from WordNet on first use).
+        Loads all of them by default.
+
+    hypernym_index_path: str
+        sqlite file of the shared keyword hypernym index, None to keep it in memory only.
+        Defaults to the PYCONVERSE_HYPERNYM_INDEX environment variable, else
+        ~/.cache/pyconverse/hypernyms.sqlite.
+    """
+    if hypernym_index_path is not False:
+        from .hypernym_index import default_hypernym_index
+        default_hypernym_index.set_path(hypernym_index_path)
+
+    if models is None:
+        models = list(_warmup_loaders)
+
+    for name in models:
+        if name not in _warmup_loaders:
+            raise ValueError("Unknown model `{}`, expected one of {}".format(
+                name, list(_warmup_loaders)))
+        _warmup_loaders[name]()
+
+
+punct_pattern = re.compile('[%s]' % re.escape(string.punctuation))
+spaces_pattern = re.compile("  +")
 
 
 def remove_punct(text):
-    punct_list = re.compile('[%s]' % re.escape(string.punctuation))
-    text = re.sub(punct_list, ' ', text)
-    text = re.sub("  +", ' ', text)
+    text = punct_pattern.sub(' ', text)
+    text = spaces_pattern.sub(' ', text)
     return text
 
 
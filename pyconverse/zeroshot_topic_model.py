@@ -1,9 +1,20 @@
 import attr
-from keybert import KeyBERT
-from .utils import load_zeroshot_model
-from nltk.corpus import wordnet as wn
+import numpy as np
+from .classification import text_label_scores
+from .embedding_cache import default_embedding_cache
+from .batching import MicroBatcher
+from .hypernym_index import default_hypernym_index
 
-classifier = load_zeroshot_model()
+
+def _cached_embedder(model_name):
+    from keybert.backend import BaseEmbedder
+
+    class CachedEmbedder(BaseEmbedder):
+        # KeyBERT backend serving document and candidate embeddings from the embedding cache
+        def embed(self, documents, verbose=False):
+            return default_embedding_cache.encode(documents, model_name)
+
+    return CachedEmbedder()
 
 
 @attr.s
@@ -13,16 +24,43 @@ class ZeroShotTopicFinder:
 
     step 1: Use transformer model to find the keywords form the text
     step 2: Use the wordnet to find most similar words and expand the keyword list.
-    step 3: Find the hypernyms for all the keywords.
+    step 3: Find the hypernyms for all the keywords (see `HypernymIndex`).
     step 4: Pass the list of hypernyms and text to your choice of zero-shot classifier and get the top labels as topic.
     """
 
     model = attr.ib(default='all-MiniLM-L6-v2')
+    _batcher = attr.ib(default=None, init=False, repr=False)
 
     def __attrs_post_init__(self):
-        self.model = KeyBERT(self.model)
+        from keybert import KeyBERT
+        if isinstance(self.model, str):
+            self.model = KeyBERT(_cached_embedder(self.model))
+        else:
+            self.model = KeyBERT(self.model)
+        self._batcher = MicroBatcher(self._find_topic_batch)
+        # pay the one-off WordNet indexing here rather than in the first find_topic
+        default_hypernym_index.ensure_built()
+
+    async def afind_topic(self, text, n_topic=2, backend='nli'):
+        """
+        Asyncio version of `find_topic`.
+
+        Texts from concurrent requests are queued, batched together and processed in a
+        worker thread, so the event loop is not blocked.
+        """
+        return (await self._batcher.submit([(text, n_topic, backend)]))[0]
 
-    def find_topic(self, text, n_topic=2):
+    def _find_topic_batch(self, items):
+        topics = [None] * len(items)
+        for backend in set(i[2] for i in items):
+            index = [i for i, item in enumerate(items) if item[2] == backend]
+            found = self.find_topics([items[i][0] for i in index], max(items[i][1] for i in index),
+                                     backend=backend)
+            for i, labels in zip(index, found):
+                topics[i] = labels[:items[i][1]]
+        return topics
+
+    def find_topic(self, text, n_topic=2, backend='nli'):
         """
         Infer the topic in a given string.
         parameters
@@ -34,6 +72,9 @@ class ZeroShotTopicFinder:
         n_topic: int
             Define the maximum number of topic you want to identify.
 
+        backend: str, nli or embedding
+            `nli` scores the candidate topics with the bart-large-mnli zero-shot model,
+            `embedding` compares sentence-transformer embeddings, much faster but a little less accurate.
 
         Returns
         -------
@@ -41,24 +82,70 @@ class ZeroShotTopicFinder:
             List of topics identified.
 
         """
-        keyword = self.get_keyword(text)
-        labels = self.get_parent_words(keyword)
-        prediction = classifier(text, candidate_labels=labels)
-        labels = prediction['labels'][:n_topic]
-        labels = [i.replace("_", ' ').title() for i in labels]
-        return labels
+        return self.find_topics([text], n_topic, backend=backend)[0]
+
+    def find_topics(self, texts, n_topic=2, batch_size=32, backend='nli'):
+        """
+        Infer the topics of a list of strings in batches.
+
+        The keywords of all the texts are extracted in one KeyBERT pass, then every text is
+        scored against its own candidate labels in batched zero-shot forward passes.
+
+        parameters
+        ----------
+        texts: list
+            list of texts for which you want to infer the topic.
+
+        n_topic: int
+            Define the maximum number of topic you want to identify per text.
+
+        batch_size: int
+            number of (text, label) pairs per zero-shot forward pass.
+
+        backend: str, nli or embedding
+            labeling backend, see `find_topic`.
+
+        Returns
+        -------
+        topics : list
+            List of topics identified for every text.
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        texts = list(texts)
+
+        label_lists = [self.get_parent_words(i) for i in self.get_keywords(texts)]
+        scores = text_label_scores(texts, label_lists, batch_size, backend)
+
+        topics = []
+        for labels, score in zip(label_lists, scores):
+            order = np.argsort(-score, kind='stable')[:n_topic]
+            topics.append([labels[i].replace("_", ' ').title() for i in order])
+        return topics
 
     def get_keyword(self, text):
-        kw = [i for (i, j) in self.model.extract_keywords(text) if j >= 0.30]
-        return kw
+        return self.get_keywords([text])[0]
+
+    def get_keywords(self, texts):
+        """
+        Returns the keywords of every text, extracted in one KeyBERT pass.
+
+        KeyBERT fits a single CountVectorizer over the batch, with the default one the candidates
+        of a text are still its own words, but a custom vectorizer with min_df/max_df can differ
+        from extracting the texts one by one.
+        """
+        if not texts:
+            return []
+        keywords = self.model.extract_keywords(list(texts))
+        # keybert 0.5.0 returns one list per document, later versions a flat list for a single one
+        if keywords and isinstance(keywords[0], tuple):
+            keywords = [keywords]
+        # documents without candidate words get "None Found" instead of a list
+        return [[i[0] for i in kw if isinstance(i, tuple) and i[1] >= 0.30] if isinstance(kw, list) else []
+                for kw in keywords]
 
     def get_parent_words(self, keywords):
-        parents = []
-        for kw in keywords:
-            sym = wn.synsets(kw)[:2]
-            parents += [j.name().split('.')
-                        for i in sym for j in i.hypernyms()]
-        parents = [i[0] for i in parents if i[1] != 'v']
+        parents = [j for kw in keywords for j in default_hypernym_index.get(kw)]
         parents = [i for i in parents if i not in keywords]
         parents = list(set(parents))
         return parents
@@ -53,6 +53,11 @@ kwargs = {
 #################### BEGIN USER OVERRIDES ####################
 # Add your customizations in this section.
 
+# the ONNX Runtime backend, see `pyconverse.set_inference_backend`
+kwargs['extras_require'] = {
+    'onnx': ['optimum[onnxruntime]>=1.8,<1.14', 'onnxruntime>=1.14', 'transformers>=4.26,<4.36'],
+}
+
 ###################### END USER OVERRIDES ####################
 
 setup(**kwargs)
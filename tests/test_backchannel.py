@@ -0,0 +1,46 @@
+import pandas as pd
+from pyconverse import BackchannelMatcher, Callyzer
+from pyconverse._const import backchannel as constants
+from pyconverse.utils import remove_punct
+
+
+def reference_is_backchannel(text):
+    clean_text = remove_punct(text)
+    return (text in constants or text.lower() in constants or
+            clean_text in constants or clean_text.lower() in constants)
+
+
+texts = ['Yep', 'yep!', 'That s nice', "That's good.", 'Right?', 'right  ', 'oh great',
+         'I will send the invoice tomorrow', 'Noted', '', 'right, right']
+
+
+def test_match_returns_aligned_bool_series():
+    data = pd.Series(texts, index=range(10, 10 + len(texts)))
+    result = BackchannelMatcher().match(data)
+    assert result.dtype == bool
+    assert result.index.equals(data.index)
+
+
+def test_match_parity_with_reference():
+    expected = [reference_is_backchannel(i) for i in texts]
+    matcher = BackchannelMatcher()
+    assert matcher.match(texts).tolist() == expected
+    assert [matcher.is_backchannel(i) for i in texts] == expected
+    assert expected[0] and expected[2] and expected[6]
+    assert not expected[7]
+
+
+def test_lexicon_and_extra():
+    matcher = BackchannelMatcher(lexicon=['sure'], extra=['got it'])
+    assert matcher.match(['Sure', 'got-it', 'yep']).tolist() == [True, True, False]
+    assert BackchannelMatcher(extra=['noted']).match(['Noted', 'yep']).tolist() == [True, True]
+
+
+def test_tag_backchannel_lexicon():
+    data = pd.DataFrame({'speaker': ['a', 'b', 'a'], 'utterance': ['Yep', 'Got it', 'Noted'],
+                         'startTime': [0, 1, 2], 'endTime': [1, 2, 3]})
+    callyzer = Callyzer(data)
+    assert callyzer.tag_backchannel(inplace=False).tolist() == [True, False, False]
+    assert callyzer.tag_backchannel(inplace=False, lexicon=['got it', 'noted']).tolist() == [False, True, True]
+    matcher = BackchannelMatcher(extra=['noted'])
+    assert callyzer.tag_backchannel(inplace=False, lexicon=matcher).tolist() == [True, False, True]
@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+from pyconverse.batching import MicroBatcher
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 5))
+
+
+def test_results_per_caller():
+    calls = []
+
+    def double(items):
+        calls.append(items)
+        return [i * 2 for i in items]
+
+    batcher = MicroBatcher(double, max_batch_size=8)
+
+    async def main():
+        return await asyncio.gather(batcher.submit([1, 2]), batcher.submit([3]), batcher.submit([]))
+
+    assert run(main()) == [[2, 4], [6], []]
+    assert calls == [[1, 2, 3]]
+
+
+def test_failing_item_is_isolated():
+    def check(items):
+        if 'bad' in items:
+            raise KeyError('bad')
+        return [i.upper() for i in items]
+
+    batcher = MicroBatcher(check)
+
+    async def main():
+        return await asyncio.gather(batcher.submit(['a']), batcher.submit(['bad']), batcher.submit(['b']),
+                                    return_exceptions=True)
+
+    good, bad, other = run(main())
+    assert good == ['A'] and other == ['B']
+    assert isinstance(bad, KeyError)
+
+
+def test_short_results_do_not_hang():
+    batcher = MicroBatcher(lambda items: items[:-1])
+
+    async def main():
+        return await asyncio.gather(batcher.submit(['a', 'bb']), return_exceptions=True)
+
+    result, = run(main())
+    assert isinstance(result, ValueError)
+
+
+def test_short_batch_results_are_retried():
+    # only the first result of a batch is kept, one item at a time works
+    batcher = MicroBatcher(lambda items: [len(i) for i in items][:1])
+    assert run(batcher.submit(['a', 'bb'])) == [1, 2]
+
+
+def test_close_fails_waiting_items():
+    started = []
+
+    def slow(items):
+        started.append(items)
+        return items
+
+    batcher = MicroBatcher(slow, max_wait=10)
+
+    async def main():
+        task = asyncio.ensure_future(batcher.submit(['a']))
+        await asyncio.sleep(0.05)
+        batcher.close()
+        with pytest.raises(RuntimeError):
+            await task
+
+    run(main())
+    assert started == []
+
+
+def test_new_event_loop():
+    batcher = MicroBatcher(lambda items: items)
+    assert run(batcher.submit([1])) == [1]
+    assert run(batcher.submit([2])) == [2]
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from pyconverse import classification
+
+
+@pytest.fixture(autouse=True)
+def thresholds(monkeypatch):
+    monkeypatch.setattr(classification, 'embedding_thresholds', {})
+
+
+def test_top_labels():
+    scores = np.array([[0.5, 0.3, 0.2], [0.4, 0.35, 0.25]])
+    assert classification.top_labels(scores, ['a', 'b', 'c']) == ['a', 'not found']
+    assert classification.top_labels(scores, ['a', 'b', 'c'], 0.0) == ['a', 'a']
+
+
+def test_label_threshold():
+    assert classification.label_threshold(['a', 'b'], 'nli') == 0.45
+    # uncalibrated label sets: best label one temperature above the others
+    assert classification.label_threshold(['a', 'b'], 'embedding') == pytest.approx(np.e / (1 + np.e))
+    assert classification.label_threshold([], 'embedding') == 0.0
+    with pytest.raises(ValueError):
+        classification.label_threshold(['a', 'b'], 'tfidf')
+
+
+def test_calibrate_embedding_thresholds(monkeypatch):
+    labels = ['a', 'b', 'c']
+    # NLI: confident on the first two texts, "not found" on the last two
+    nli = np.array([[0.9, 0.05, 0.05], [0.1, 0.8, 0.1], [0.4, 0.3, 0.3], [0.35, 0.35, 0.3]])
+    embedding = np.array([[0.7, 0.2, 0.1], [0.2, 0.65, 0.15], [0.5, 0.3, 0.2], [0.6, 0.3, 0.1]])
+    monkeypatch.setattr(classification, 'zeroshot_label_set_scores', lambda *args: {'x': nli})
+    monkeypatch.setattr(classification, 'embedding_label_set_scores', lambda *args: {'x': embedding})
+
+    calibration = classification.calibrate_embedding_thresholds(['t'] * 4, {'x': labels})
+    assert calibration == {'x': (0.65, 1.0)}
+    assert classification.label_threshold(labels, 'embedding') == 0.65
+    assert classification.top_labels(embedding, labels, 0.65) == ['a', 'b', 'not found', 'not found']
+
+
+def test_default_thresholds_of_builtin_labels():
+    # the shipped thresholds, the fixture swaps in an empty dict
+    from pyconverse.insights import emotion_labels, empathy_labels, embedding_thresholds as defaults
+    for labels in (emotion_labels, empathy_labels):
+        threshold = defaults[tuple(labels)]
+        assert threshold == pytest.approx(classification.margin_threshold(len(labels)), abs=1e-3)
+        # a uniform row is "not found", a clear best label is found
+        uniform = np.full((1, len(labels)), 1 / len(labels))
+        assert classification.top_labels(uniform, labels, threshold) == ['not found']
+        clear = classification._softmax(np.eye(len(labels))[:1] * 0.1 / 0.05)
+        assert classification.top_labels(clear, labels, threshold) == [labels[0]]
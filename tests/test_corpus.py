@@ -0,0 +1,73 @@
+import importlib
+import numpy as np
+import pandas as pd
+import pytest
+from pyconverse import CorpusAnalyzer, TranscriptSummarization
+
+corpus_module = importlib.import_module('pyconverse.corpus')
+insights_module = importlib.import_module('pyconverse.insights')
+
+
+def make_corpus(n_calls=3, n=5):
+    return pd.DataFrame({'call_id': np.repeat(np.arange(n_calls), n),
+                         'speaker': ['agent', 'customer'] * (n_calls * n // 2) + ['agent'] * (n_calls * n % 2),
+                         'utterance': ['yep' if i % 3 == 0 else 'utterance {}'.format(i)
+                                       for i in range(n_calls * n)],
+                         'startTime': range(n_calls * n), 'endTime': range(1, n_calls * n + 1)})
+
+
+def test_tag_labels_in_chunks(monkeypatch):
+    sizes = []
+
+    def label_set_scores(texts, label_sets, batch_size=32, backend='nli'):
+        sizes.append(len(texts))
+        return {name: np.tile(np.eye(len(labels))[0], (len(texts), 1)) for name, labels in label_sets.items()}
+
+    monkeypatch.setattr(insights_module, 'label_set_scores', label_set_scores)
+    labels = CorpusAnalyzer(make_corpus(), chunk_size=4).tag_labels({'topic': ['a', 'b']})
+    assert sizes == [4, 4, 4, 3]
+    assert labels['topic'].tolist() == ['a'] * 15
+    assert labels['utterance_idx'].tolist() == list(range(5)) * 3
+
+
+def test_tag_backchannel_in_chunks(monkeypatch):
+    sizes = []
+
+    def nlp_backchannel(self, utterances, model='all-MiniLM-L6-v2', max_words=None):
+        sizes.append(len(utterances))
+        return [i == 'yep' for i in utterances]
+
+    monkeypatch.setattr(insights_module.Callyzer, '_nlp_backchannel', nlp_backchannel)
+    data = make_corpus()
+    corpus = CorpusAnalyzer(data, chunk_size=4)
+    expected = (data['utterance'] == 'yep').tolist()
+    assert corpus.tag_backchannel('nlp')['is_backchannel'].tolist() == expected
+    assert sizes == [4, 4, 4, 3]
+    assert corpus.tag_backchannel()['is_backchannel'].tolist() == expected
+
+
+def test_summaries_are_batched_across_calls(monkeypatch):
+    calls = []
+
+    def segment_texts(self):
+        first = self.data[self.utterance].iloc[0]
+        return [None, first, None, first + ' again'] if first != 'yep' else [None]
+
+    def summarize(self, texts, batch_size=8, max_batch_tokens=8192):
+        calls.append(list(texts))
+        return [i.upper() for i in texts]
+
+    monkeypatch.setattr(corpus_module, 'load_summarization_model', lambda: 'model')
+    monkeypatch.setattr(TranscriptSummarization, '_get_segment_texts', segment_texts)
+    monkeypatch.setattr(TranscriptSummarization, '_summarize', summarize)
+
+    summaries = CorpusAnalyzer(make_corpus()).get_summary()
+    assert calls == [['utterance 5', 'utterance 5 again', 'utterance 10', 'utterance 10 again']]
+    assert summaries['summary'].tolist() == ['', 'UTTERANCE 5UTTERANCE 5 AGAIN',
+                                             'UTTERANCE 10UTTERANCE 10 AGAIN']
+
+
+def test_empty_corpus():
+    corpus = CorpusAnalyzer(make_corpus().iloc[:0])
+    assert corpus.tag_backchannel().empty
+    assert list(corpus.get_summary().columns) == ['call_id', 'summary']
@@ -0,0 +1,59 @@
+import importlib
+import pandas as pd
+import pytest
+from pyconverse import CorpusAnalyzer, DocStore
+
+doc_store_module = importlib.import_module('pyconverse.doc_store')
+
+
+class FakeDoc(str):
+    pass
+
+
+@pytest.fixture
+def parsed(monkeypatch):
+    parsed = []
+
+    def parse_texts(texts, n_process=1, batch_size=256):
+        parsed.extend(texts)
+        return [FakeDoc(i) for i in texts]
+
+    monkeypatch.setattr(doc_store_module, 'parse_texts', parse_texts)
+    monkeypatch.setattr(doc_store_module, 'load_spacy', lambda: lambda text: parse_texts([text])[0])
+    return parsed
+
+
+def test_texts_parsed_once(parsed):
+    store = DocStore()
+    assert store.get_docs(['a', 'b', 'a']) == ['a', 'b', 'a']
+    assert store.get_docs(['b', 'c']) == ['b', 'c']
+    assert store.get('a') == 'a'
+    assert parsed == ['a', 'b', 'c']
+    assert len(store) == 3
+
+
+def test_bounded_store(parsed):
+    store = DocStore(max_size=2)
+    # more distinct texts than the store holds are still all returned
+    assert store.get_docs(['a', 'b', 'c', 'a']) == ['a', 'b', 'c', 'a']
+    assert len(store) == 2 and 'a' not in store
+    store.get('b')
+    store.get('d')
+    assert 'b' in store and 'c' not in store
+    assert parsed == ['a', 'b', 'c', 'd']
+
+
+def test_corpus_store_is_bounded(parsed, monkeypatch):
+    data = pd.DataFrame({'call_id': [1, 1, 2, 2, 2],
+                         'speaker': ['a', 'b', 'a', 'b', 'a'],
+                         'utterance': ['how are you doing', 'fine thanks a lot', 'what is the plan',
+                                       'nothing much really', 'where are you now'],
+                         'startTime': range(5), 'endTime': range(1, 6)})
+    monkeypatch.setattr('pyconverse.insights.Callyzer._is_doc_question',
+                        lambda self, doc: doc.split()[0] in ('how', 'what', 'where'))
+
+    corpus = CorpusAnalyzer(data, max_docs=2, chunk_size=2)
+    questions = corpus.tag_questions()
+    assert questions['is_question'].tolist() == [True, False, True, False, True]
+    assert questions['utterance_idx'].tolist() == [0, 1, 0, 1, 2]
+    assert len(corpus.doc_store) == 2
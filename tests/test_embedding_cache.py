@@ -0,0 +1,125 @@
+import importlib
+import os
+import threading
+import numpy as np
+import pytest
+
+cache_module = importlib.import_module('pyconverse.embedding_cache')
+key = cache_module._text_hash
+
+
+class FakeEncoder:
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, batch_size=32):
+        self.encoded += list(texts)
+        return np.array([[len(i), sum(map(ord, i)) % 251, 1] for i in texts], dtype=np.float32)
+
+    def get_sentence_embedding_dimension(self):
+        return 3
+
+
+@pytest.fixture
+def encoder(monkeypatch):
+    encoder = FakeEncoder()
+    monkeypatch.setattr(cache_module, 'load_sentence_transformer', lambda *args, **kwargs: encoder)
+    return encoder
+
+
+def test_encode_only_misses(encoder):
+    cache = cache_module.EmbeddingCache()
+    first = cache.encode(['a', 'bb', 'a'])
+    second = cache.encode(['bb', 'ccc'])
+    assert encoder.encoded == ['a', 'bb', 'ccc']
+    np.testing.assert_array_equal(first[0], first[2])
+    np.testing.assert_array_equal(first[1], second[0])
+    assert cache.stats()['hits'] == 2 and cache.stats()['misses'] == 3
+
+
+def test_lru_eviction(encoder):
+    cache = cache_module.EmbeddingCache(max_size=2)
+    cache.encode(['a', 'bb'])
+    cache.encode(['a'])
+    cache.encode(['ccc'])
+    assert cache.stats()['size'] == 2
+    cache.encode(['a', 'ccc'])
+    cache.encode(['bb'])
+    assert encoder.encoded == ['a', 'bb', 'ccc', 'bb']
+
+
+def test_empty_input(encoder):
+    assert cache_module.EmbeddingCache().encode([]).shape == (0, 3)
+
+
+def test_disk_tier_shared_between_runs(encoder, tmp_path):
+    expected = cache_module.EmbeddingCache(path=str(tmp_path)).encode(['a', 'bb'])
+    cache = cache_module.EmbeddingCache(path=str(tmp_path))
+    np.testing.assert_array_equal(cache.encode(['bb', 'a']), expected[::-1])
+    assert encoder.encoded == ['a', 'bb']
+
+
+def test_disk_tier_row_without_index(tmp_path):
+    tier = cache_module._DiskTier(str(tmp_path))
+    tier.add([key('a')], np.array([[1, 1, 1]]))
+    # vectors appended without their index entry, as after a crash between the two writes
+    with open(tier._matrix_path, 'ab') as f:
+        f.write(np.array([[9, 9, 9]], dtype=np.float32).tobytes() + b'\x00\x00')
+    tier.add([key('b')], np.array([[4, 122, 1]]))
+
+    reloaded = cache_module._DiskTier(str(tmp_path))
+    np.testing.assert_array_equal(reloaded.get(key('a')), [1, 1, 1])
+    np.testing.assert_array_equal(reloaded.get(key('b')), [4, 122, 1])
+
+
+def test_disk_tier_two_writers(tmp_path):
+    first = cache_module._DiskTier(str(tmp_path))
+    second = cache_module._DiskTier(str(tmp_path))
+    first.add([key('a')], np.array([[1, 1, 1]]))
+    second.add([key('b')], np.array([[4, 122, 1]]))
+    first.add([key('c')], np.array([[7, 7, 7]]))
+
+    reloaded = cache_module._DiskTier(str(tmp_path))
+    for text, vector in [('a', [1, 1, 1]), ('b', [4, 122, 1]), ('c', [7, 7, 7])]:
+        np.testing.assert_array_equal(reloaded.get(key(text)), vector)
+    np.testing.assert_array_equal(first.get(key('b')), [4, 122, 1])
+
+
+def test_disk_tier_dimension_mismatch(tmp_path):
+    tier = cache_module._DiskTier(str(tmp_path))
+    tier.add([key('a')], np.array([[1, 1, 1]]))
+    with pytest.raises(ValueError):
+        tier.add([key('b')], np.array([[1, 1]]))
+
+
+def test_disk_tier_appends_only(tmp_path):
+    tier = cache_module._DiskTier(str(tmp_path))
+    for i in range(5):
+        tier.add([key(str(i))], np.array([[i, i, i]]))
+        assert os.path.getsize(tier._keys_path) == 20 * (i + 1)
+        assert os.path.getsize(tier._matrix_path) == 12 * (i + 1)
+    assert sorted(os.listdir(str(tmp_path))) == ['embeddings.f32', 'keys.sha1', 'lock', 'meta.json']
+
+
+def test_encode_outside_lock(monkeypatch):
+    cache = cache_module.EmbeddingCache()
+
+    class LockCheckingEncoder(FakeEncoder):
+        def encode(self, texts, batch_size=32):
+            # another thread can use the cache while this one encodes
+            acquired = []
+
+            def use_cache():
+                acquired.append(cache._lock.acquire(timeout=1))
+                if acquired[-1]:
+                    cache._lock.release()
+
+            thread = threading.Thread(target=use_cache)
+            thread.start()
+            thread.join()
+            assert acquired == [True]
+            return super().encode(texts, batch_size)
+
+    monkeypatch.setattr(cache_module, 'load_sentence_transformer', lambda *args, **kwargs: LockCheckingEncoder())
+    assert cache.encode(['a', 'bb']).shape == (2, 3)
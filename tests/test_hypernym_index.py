@@ -0,0 +1,125 @@
+import os
+import sys
+import types
+import pytest
+from pyconverse.hypernym_index import HypernymIndex, _default_index_path
+
+
+class Synset:
+
+    def __init__(self, name, hypernyms=()):
+        self._name = name
+        self._hypernyms = hypernyms
+
+    def name(self):
+        return self._name
+
+    def hypernyms(self):
+        return [Synset(i) for i in self._hypernyms]
+
+
+SYNSETS = {
+    'refund': [Synset('refund.n.01', ['repayment.n.01']), Synset('refund.v.01', ['give.v.03'])],
+    'payment': [Synset('payment.n.01', ['cost.n.01', 'cost.n.02']), Synset('payment.n.02', ['act.n.02'])],
+    'payments': [Synset('payment.n.01', ['cost.n.01'])],
+}
+
+
+@pytest.fixture
+def wordnet(monkeypatch):
+    wordnet = types.SimpleNamespace(lookups=[])
+
+    def synsets(word):
+        wordnet.lookups.append(word)
+        return SYNSETS.get(word, [])
+
+    wordnet.synsets = synsets
+    wordnet.all_lemma_names = lambda: iter(['refund', 'payment', 'hello'])
+    corpus = types.ModuleType('nltk.corpus')
+    corpus.wordnet = wordnet
+    monkeypatch.setitem(sys.modules, 'nltk', types.ModuleType('nltk'))
+    monkeypatch.setitem(sys.modules, 'nltk.corpus', corpus)
+    return wordnet
+
+
+def test_hypernyms_without_file(wordnet):
+    index = HypernymIndex()
+    assert index.get('refund') == ('repayment',)
+    assert index.get('refund') == ('repayment',)
+    assert wordnet.lookups == ['refund']
+    assert index.stats()['hits'] == 1
+
+
+def test_built_index_needs_no_wordnet(wordnet, tmp_path):
+    path = str(tmp_path / 'hypernyms.sqlite')
+    HypernymIndex(path, auto_build=True).ensure_built()
+    assert len(wordnet.lookups) == 3
+
+    index = HypernymIndex(path, auto_build=True)
+    assert index.is_built()
+    index.ensure_built()
+    assert index.get('payment') == ('cost', 'cost', 'act')
+    assert index.get('hello') == ()
+    assert len(wordnet.lookups) == 3
+
+
+def test_missing_keyword_added_to_file(wordnet, tmp_path):
+    path = str(tmp_path / 'hypernyms.sqlite')
+    index = HypernymIndex(path)
+    index.build(words=['refund'])
+    assert not index.is_built()
+    assert index.get('payments') == ('cost',)
+    assert HypernymIndex(path).get('payments') == ('cost',)
+    assert wordnet.lookups == ['refund', 'payments']
+
+
+def test_lru_eviction(wordnet):
+    index = HypernymIndex(max_size=1)
+    index.get('refund')
+    index.get('payment')
+    index.get('refund')
+    assert wordnet.lookups == ['refund', 'payment', 'refund']
+
+
+def test_build_needs_a_path(wordnet):
+    with pytest.raises(ValueError):
+        HypernymIndex().build(words=['refund'])
+
+
+def test_unwritable_path_falls_back_to_memory(wordnet, tmp_path, caplog):
+    blocker = tmp_path / 'file'
+    blocker.write_text('')
+    index = HypernymIndex(str(blocker / 'hypernyms.sqlite'), auto_build=True)
+    assert index.ensure_built() is index
+    assert index.path is None
+    assert index.get('refund') == ('repayment',)
+    assert 'keeping it in memory' in caplog.text
+
+
+def test_build_once_under_lock(wordnet, tmp_path):
+    path = str(tmp_path / 'hypernyms.sqlite')
+    first, second = HypernymIndex(path, auto_build=True), HypernymIndex(path, auto_build=True)
+    assert not second.is_built()
+    first.ensure_built()
+    second.ensure_built()
+    assert len(wordnet.lookups) == 3
+    assert os.path.exists(path + '.lock')
+
+
+def test_default_path_from_environment(monkeypatch, tmp_path):
+    monkeypatch.setenv('PYCONVERSE_HYPERNYM_INDEX', str(tmp_path / 'index.sqlite'))
+    assert _default_index_path() == str(tmp_path / 'index.sqlite')
+    monkeypatch.setenv('PYCONVERSE_HYPERNYM_INDEX', '')
+    assert _default_index_path() is None
+    monkeypatch.delenv('PYCONVERSE_HYPERNYM_INDEX')
+    assert _default_index_path().endswith('hypernyms.sqlite')
+
+
+def test_warmup_sets_the_path(monkeypatch, tmp_path):
+    from pyconverse import default_hypernym_index, warmup
+    monkeypatch.setattr(default_hypernym_index, 'path', default_hypernym_index.path)
+    monkeypatch.setattr(default_hypernym_index, 'auto_build', False)
+    warmup(['hypernyms'], hypernym_index_path=str(tmp_path / 'index.sqlite'))
+    assert default_hypernym_index.path == str(tmp_path / 'index.sqlite')
+    warmup([], hypernym_index_path=None)
+    assert default_hypernym_index.path is None
@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pyconverse import Callyzer
+
+
+def make_call(seed, n=40):
+    rng = np.random.RandomState(seed)
+    start = np.cumsum(rng.randint(0, 4, n))
+    return pd.DataFrame({'speaker': rng.choice(['agent', 'customer'], n),
+                         'utterance': ['utterance {}'.format(i) for i in range(n)],
+                         'startTime': start,
+                         'endTime': start + rng.randint(0, 6, n)})
+
+
+# reference implementations with the semantics of the original row by row loops
+
+def reference_turn_ids(data):
+    turn, channel, turns = 0, None, []
+    for speaker in data['speaker']:
+        if channel is None:
+            channel = speaker
+        if channel != speaker:
+            channel = speaker
+            turn += 1
+        turns.append(turn)
+    return turns
+
+
+def reference_events(data, threshold, silence):
+    starts, ends = data['startTime'].tolist(), data['endTime'].tolist()
+    ids = [i for i, (et, st) in enumerate(zip(ends[:-1], starts[1:]))
+           if (st - et if silence else et - st) >= threshold]
+    return_dict = {k: dict(metadata=[], count=0) for k in data['speaker'].unique()}
+    for idx in ids:
+        row = data.iloc[idx + 1]
+        return_dict[row['speaker']]['metadata'].append(
+            dict(start_time=row['startTime'], end_time=row['endTime'], index=idx + 1))
+        return_dict[row['speaker']]['count'] += 1
+    return_dict['total_interruption'] = len(ids)
+    return return_dict
+
+
+def reference_turns(data):
+    turns = []
+    for _, df in data.groupby(reference_turn_ids(data)):
+        row = df.iloc[0].copy()
+        if len(df) > 1:
+            row['utterance'] = ' '.join(df['utterance'].tolist())
+            row['endTime'] = df.iloc[-1]['endTime']
+        turns.append(row)
+    return pd.concat(turns, axis=1).T
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_turn_ids(seed):
+    data = make_call(seed)
+    assert Callyzer(data.copy()).get_turn_ids(in_place=False) == reference_turn_ids(data)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('threshold', [0, 1, 3])
+def test_silence_and_interruption(seed, threshold):
+    data = make_call(seed)
+    call = Callyzer(data.copy())
+    assert call.get_silence(threshold) == reference_events(data, threshold, silence=True)
+    assert call.get_interruption(threshold) == reference_events(data, threshold, silence=False)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_gap_events(seed):
+    data = make_call(seed)
+    events = Callyzer(data.copy()).get_gap_events(2, 1)
+    silence = reference_events(data, 2, silence=True)
+    interruption = reference_events(data, 1, silence=False)
+    assert (events['event'] == 'silence').sum() == silence['total_interruption']
+    assert (events['event'] == 'interruption').sum() == interruption['total_interruption']
+    gaps = data['startTime'].to_numpy()[events['index']] - data['endTime'].to_numpy()[events['index'] - 1]
+    np.testing.assert_array_equal(events['gap'], gaps)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_convert_at_turn(seed):
+    data = make_call(seed)
+    turns = Callyzer(data.copy()).convert_at_turn()
+    expected = reference_turns(data)
+    assert turns['utterance'].tolist() == expected['utterance'].tolist()
+    assert turns['endTime'].tolist() == expected['endTime'].tolist()
+    assert turns['startTime'].tolist() == expected['startTime'].tolist()
+
+
+def test_convert_at_turn_missing_utterances():
+    data = pd.DataFrame({'speaker': ['a', 'b', 'b', 'a', 'a'],
+                         'utterance': [np.nan, 'yes', None, None, np.nan],
+                         'startTime': [0, 1, 2, 3, 4],
+                         'endTime': [1, 2, 3, 4, 5]})
+    turns = Callyzer(data).convert_at_turn()
+    assert pd.isna(turns['utterance'].iloc[0])
+    assert turns['utterance'].iloc[1] == 'yes'
+    assert pd.isna(turns['utterance'].iloc[2])
+    assert turns['endTime'].tolist() == [1, 3, 5]
+
+
+def test_convert_at_turn_duplicate_index():
+    data = make_call(0, 10)
+    data = pd.concat([data.iloc[:4], data.iloc[4:].reset_index(drop=True)])
+    turns = Callyzer(data.copy()).convert_at_turn()
+    expected = reference_turns(data)
+    assert turns['utterance'].tolist() == expected['utterance'].tolist()
+    assert turns['endTime'].tolist() == expected['endTime'].tolist()
+
+    data = pd.DataFrame({'speaker': ['a', 'a', 'b'], 'utterance': ['hi', 'there', 'yes'],
+                         'startTime': [0, 1, 2], 'endTime': [1, 2, 3]}, index=[0, 0, 1])
+    turns = Callyzer(data).convert_at_turn()
+    assert turns['utterance'].tolist() == ['hi there', 'yes']
+    assert turns['endTime'].tolist() == [2, 3]
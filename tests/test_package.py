@@ -0,0 +1,20 @@
+import importlib
+import types
+import pytest
+import pyconverse
+
+
+@pytest.mark.parametrize('name', ['registry', 'embedding_cache', 'hypernym_index'])
+def test_submodules_not_shadowed(name):
+    assert isinstance(getattr(pyconverse, name), types.ModuleType)
+    assert isinstance(importlib.import_module('pyconverse.' + name), types.ModuleType)
+
+
+def test_model_registry():
+    loads = []
+    registry = pyconverse.model_registry
+    first = registry.get('test-task', 'model', lambda: loads.append(1) or object())
+    assert registry.get('test-task', 'model', lambda: loads.append(1) or object()) is first
+    assert ('test-task', 'model', -1, None, 'torch') in registry.loaded()
+    assert registry.unload('test-task') == [('test-task', 'model', -1, None, 'torch')]
+    assert loads == [1]
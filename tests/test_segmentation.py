@@ -0,0 +1,108 @@
+import importlib
+import re
+import sys
+import types
+import numpy as np
+import pandas as pd
+import pytest
+from pyconverse import SemanticTextSegmentation
+
+segmentation_module = importlib.import_module('pyconverse.segmentation')
+
+
+def reference_embedding_tilling(embeddings, window):
+    # TextTiling depth scores computed gap by gap
+    n = len(embeddings)
+    if n < 2 * window:
+        return []
+    sims = []
+    for gap in range(1, n):
+        left = embeddings[max(gap - window, 0):gap].sum(axis=0)
+        right = embeddings[gap:min(gap + window, n)].sum(axis=0)
+        norm = np.linalg.norm(left) * np.linalg.norm(right)
+        sims.append(left @ right / norm if norm > 0 else 0.0)
+    depth = [max(sims[max(i - window, 0):i + 1]) + max(sims[i:i + window + 1]) - 2 * sims[i]
+             for i in range(len(sims))]
+    cutoff = np.mean(depth) - np.std(depth) / 2
+    boundaries = []
+    for i in range(len(depth)):
+        is_peak = depth[i] >= max(depth[max(i - window, 0):i + window + 1])
+        if (is_peak and depth[i] > cutoff and (not boundaries or i - boundaries[-1] >= window)
+                and window <= i + 1 <= n - window):
+            boundaries.append(i)
+    return [i + 1 for i in boundaries]
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    vectors = {}
+
+    def encode(texts, *args, **kwargs):
+        return np.array([vectors[i] for i in texts], dtype=np.float32)
+
+    monkeypatch.setattr(segmentation_module.default_embedding_cache, 'encode', encode)
+    return vectors
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('window', [1, 2, 3])
+def test_embedding_tilling_matches_reference(embeddings, seed, window):
+    rng = np.random.RandomState(seed)
+    texts = ['utterance {}'.format(i) for i in range(30)]
+    topics = np.repeat(rng.randn(4, 8), [7, 9, 6, 8], axis=0)
+    vectors = (topics + 0.3 * rng.randn(30, 8)).astype(np.float32)
+    embeddings.update(zip(texts, vectors))
+
+    boundaries = SemanticTextSegmentation(pd.DataFrame({'utterance': texts}))._embedding_tilling(window)
+    assert boundaries == reference_embedding_tilling(vectors.astype(np.float64), window)
+
+
+def test_embedding_tilling_finds_topic_changes(embeddings):
+    texts = ['utterance {}'.format(i) for i in range(24)]
+    embeddings.update(zip(texts, np.repeat(np.eye(3), 8, axis=0)))
+    segmentation = SemanticTextSegmentation(pd.DataFrame({'utterance': texts}))
+    assert segmentation._embedding_tilling(3) == [8, 16]
+    assert segmentation._embedding_tilling(20) == []
+
+
+@pytest.fixture
+def texttiling(monkeypatch):
+    class TextTilingTokenizer:
+        # splits the joined text before the given utterances, where nltk splits: at the paragraph break
+        breaks = []
+
+        def __init__(self, w, k):
+            pass
+
+        def tokenize(self, text):
+            starts = [0] + [i.start() for i in re.finditer('\n\n\t', text)]
+            cuts = [0] + [starts[i] for i in self.breaks] + [len(text)]
+            return [text[i:j] for i, j in zip(cuts[:-1], cuts[1:])]
+
+    module = types.ModuleType('nltk.tokenize.texttiling')
+    module.TextTilingTokenizer = TextTilingTokenizer
+    for name in ('nltk', 'nltk.tokenize'):
+        monkeypatch.setitem(sys.modules, name, types.ModuleType(name))
+    monkeypatch.setitem(sys.modules, 'nltk.tokenize.texttiling', module)
+    return TextTilingTokenizer
+
+
+@pytest.mark.parametrize('breaks', [[], [1], [2, 5], [1, 2, 3, 6]])
+def test_text_tilling_boundaries(texttiling, breaks):
+    texts = ['hello there', 'a', 'how are you doing today', 'fine', 'thanks a lot', 'bye', 'ok then']
+    texttiling.breaks = breaks
+    segments, boundaries = SemanticTextSegmentation(pd.DataFrame({'utterance': texts}))._text_tilling()
+    assert boundaries == [0] + breaks
+    bounds = boundaries + [len(texts)]
+    for segment, start, end in zip(segments, bounds[:-1], bounds[1:]):
+        assert segment.strip() == ' '.join(texts[start:end])
+
+
+def test_segment_index_covers_every_utterance(texttiling, monkeypatch):
+    texts = ['utterance {}'.format(i) for i in range(10)]
+    texttiling.breaks = [2, 5, 7]
+    # the second and third segments are similar enough to be merged
+    monkeypatch.setattr(SemanticTextSegmentation, '_get_similarities',
+                        lambda self, segments: np.array([0.1, 0.9, 0.2]))
+    index = SemanticTextSegmentation(pd.DataFrame({'utterance': texts})).get_segment_index()
+    assert index == [[0, 1], [2, 3, 4, 5, 6], [7, 8, 9]]
@@ -0,0 +1,148 @@
+import sys
+import types
+import numpy as np
+import pandas as pd
+import pytest
+from pyconverse.speaker_stats import SpeakerStats, psychological_correlates, stats_columns
+
+
+def reference_correlation(data, num_words_threshold=100, wps_threshold=20):
+    # the single pass of the original while loop, without the loop itself
+    informative_correlates = []
+    if data['num_words'] > num_words_threshold:
+        informative_correlates.append(psychological_correlates['num_words'])
+    if data['wps'] > wps_threshold:
+        informative_correlates.append(psychological_correlates['wps'])
+
+    d = dict(sorted(data.items(), key=lambda x: x[1], reverse=True))
+    for i, j in d.items():
+        if j == 0:
+            continue
+        if i == 'num_prep' and d['num_pronouns'] == d['num_prep'] and len(informative_correlates) == 2:
+            informative_correlates.append(psychological_correlates['num_pronouns'])
+        elif i not in ['num_words', 'wps']:
+            informative_correlates.append(psychological_correlates[i])
+    return informative_correlates
+
+
+@pytest.fixture
+def speaker_stats():
+    return SpeakerStats(pd.DataFrame({'speaker': ['a'], 'utterance': ['hello']}))
+
+
+def row(**values):
+    return {k: values.get(k, 0) for k in stats_columns}
+
+
+def test_all_zero_stats_terminate(speaker_stats):
+    assert speaker_stats._get_correlation(row()) == []
+    assert speaker_stats._get_top_correlates(pd.DataFrame([row()])).tolist() == [None]
+
+
+def test_ties_keep_column_order(speaker_stats):
+    data = row(num_negations=2, num_articles=2, num_past=1)
+    assert speaker_stats._get_correlation(data) == [psychological_correlates['num_articles'],
+                                                    psychological_correlates['num_negations'],
+                                                    psychological_correlates['num_past']]
+
+
+def test_thresholds_come_first(speaker_stats):
+    data = row(num_words=150, wps=25, num_past=3)
+    assert speaker_stats._get_correlation(data) == [psychological_correlates['num_words'],
+                                                    psychological_correlates['wps'],
+                                                    psychological_correlates['num_past']]
+
+
+def test_preposition_tie_is_informal(speaker_stats):
+    data = row(num_words=150, num_prep=4, num_pronouns=4)
+    assert speaker_stats._get_correlation(data) == [psychological_correlates['num_words'],
+                                                    psychological_correlates['num_pronouns'],
+                                                    psychological_correlates['num_pronouns']]
+    # only the third correlate is replaced
+    assert speaker_stats._get_correlation(row(num_prep=4, num_pronouns=4)) == [
+        psychological_correlates['num_pronouns'], psychological_correlates['num_prep']]
+
+
+def test_top_correlates(speaker_stats):
+    stats = pd.DataFrame([row(), row(num_future=1), row(num_words=101, num_past=5)])
+    assert speaker_stats._get_top_correlates(stats).tolist() == [
+        None, psychological_correlates['num_future'], psychological_correlates['num_words']]
+
+
+def test_matches_reference_on_random_stats(speaker_stats):
+    rng = np.random.RandomState(0)
+    stats = pd.DataFrame(rng.randint(0, 4, size=(500, len(stats_columns))), columns=stats_columns)
+    stats['num_words'] = rng.choice([0, 50, 101, 150], size=len(stats))
+    stats['wps'] = rng.choice([0, 10, 21, 30], size=len(stats))
+
+    expected = [reference_correlation(i) for i in stats.to_dict('records')]
+    assert [speaker_stats._get_correlation(i) for i in stats.to_dict('records')] == expected
+    assert speaker_stats._get_top_correlates(stats).tolist() == [i[0] if i else None for i in expected]
+
+
+# fake spacy docs for the token array stats, the reference counts are the original per-token counters
+
+TAGS = ['PRP', 'PRP$', 'WP', 'WP$', 'DT', 'VBD', 'VBN', 'MD', 'IN', 'NN', 'VB', '.']
+DEPS = ['neg', 'nsubj', 'dobj', 'punct']
+
+
+class Strings(dict):
+    def __missing__(self, key):
+        return self.setdefault(key, 1000 + len(self))
+
+
+class Token:
+    def __init__(self, tag, dep, is_sent_start):
+        self.tag_, self.dep_, self.is_sent_start = tag, dep, is_sent_start
+        self.is_punct = tag == '.'
+
+
+class Doc(list):
+    vocab = types.SimpleNamespace(strings=Strings())
+
+    @property
+    def sents(self):
+        starts = [i for i, token in enumerate(self) if i == 0 or token.is_sent_start]
+        return [self[i:j] for i, j in zip(starts, starts[1:] + [len(self)])]
+
+    def to_array(self, attrs):
+        columns = dict(TAG=lambda t: self.vocab.strings[t.tag_], IS_PUNCT=lambda t: int(t.is_punct),
+                       DEP=lambda t: self.vocab.strings[t.dep_],
+                       SENT_START=lambda t: 1 if t.is_sent_start else -1)
+        return np.array([[columns[a](t) for a in attrs] for t in self], dtype=np.int64).astype(np.uint64)
+
+
+def reference_doc_stats(doc):
+    tags = [t.tag_ for t in doc]
+    count = lambda names: sum(i in names for i in tags)
+    words = lambda span: sum(not t.is_punct for t in span)
+    with np.errstate(all='ignore'):
+        wps = round(np.mean(np.array([words(i) for i in doc.sents])), 2) if len(doc) else np.nan
+    return dict(num_pronouns=count(["PRP", "PRP$", "WP", "WP$"]), num_prp=count(["PRP"]),
+                num_articles=count(['DT']), num_past=count(['VBD', 'VBN']), num_future=count(['MD']),
+                num_prep=count(['IN']), num_words=words(doc), wps=wps,
+                num_negations=sum(t.dep_ == 'neg' for t in doc))
+
+
+@pytest.fixture
+def spacy_attrs(monkeypatch):
+    attrs = types.ModuleType('spacy.attrs')
+    attrs.TAG, attrs.IS_PUNCT, attrs.DEP, attrs.SENT_START = 'TAG', 'IS_PUNCT', 'DEP', 'SENT_START'
+    monkeypatch.setitem(sys.modules, 'spacy', types.ModuleType('spacy'))
+    monkeypatch.setitem(sys.modules, 'spacy.attrs', attrs)
+
+
+def random_doc(rng, n_tokens):
+    return Doc(Token(rng.choice(TAGS), rng.choice(DEPS), rng.rand() < 0.2) for _ in range(n_tokens))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_stats_frame_matches_token_counters(speaker_stats, spacy_attrs, seed):
+    rng = np.random.RandomState(seed)
+    docs = [random_doc(rng, n) for n in rng.randint(0, 25, 40)]
+    docs += [Doc(), Doc([Token('.', 'punct', False), Token('.', 'punct', True)])]
+
+    frame = speaker_stats._get_stats_frame(docs)
+    expected = pd.DataFrame([reference_doc_stats(i) for i in docs], columns=stats_columns)
+    pd.testing.assert_frame_equal(frame, expected, check_dtype=False)
+    assert speaker_stats._get_doc_stats(docs[0]) == pytest.approx(reference_doc_stats(docs[0]), nan_ok=True)
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pyconverse import Callyzer
+from pyconverse.streaming import StreamingCallyzer
+from .test_insights import make_call
+
+
+def stream_call(data, silence_threshold, interruption_threshold):
+    stream = StreamingCallyzer(silence_threshold=silence_threshold, interruption_threshold=interruption_threshold,
+                               tag_questions=False)
+    features = [stream.append(row) for row in data.to_dict('records')]
+    return stream, pd.DataFrame(features)
+
+
+def random_call(seed):
+    data = make_call(seed)
+    rng = np.random.RandomState(seed)
+    data['utterance'] = rng.choice(['yep', 'Right', 'oh great', 'that s nice', 'I will check the invoice',
+                                    'what is my balance'], len(data))
+    return data
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('silence_threshold,interruption_threshold', [(1, 1), (2, 1), (3, 2)])
+def test_parity_with_callyzer(seed, silence_threshold, interruption_threshold):
+    data = random_call(seed)
+    stream, features = stream_call(data, silence_threshold, interruption_threshold)
+    call = Callyzer(data.copy())
+
+    assert features['turn_id'].tolist() == call.get_turn_ids(in_place=False)
+    assert stream.get_silence() == call.get_silence(silence_threshold)
+    assert stream.get_interruption() == call.get_interruption(interruption_threshold)
+    assert features['is_backchannel'].tolist() == call.tag_backchannel(inplace=False).tolist()
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('silence_threshold,interruption_threshold', [(0, 0), (1, 1), (2, 3)])
+def test_gap_events_parity(seed, silence_threshold, interruption_threshold):
+    data = random_call(seed)
+    stream, features = stream_call(data, silence_threshold, interruption_threshold)
+    expected = Callyzer(data.copy()).get_gap_events(silence_threshold, interruption_threshold)
+    events = stream.get_gap_events()
+    pd.testing.assert_frame_equal(events.reset_index(drop=True), expected.reset_index(drop=True),
+                                  check_dtype=False)
+    assert features['gap'].iloc[0] is None or np.isnan(features['gap'].iloc[0])
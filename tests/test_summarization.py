@@ -0,0 +1,90 @@
+import contextlib
+import sys
+import types
+import pandas as pd
+import pytest
+from pyconverse import TranscriptSummarization
+
+
+class Tensor(list):
+    def to(self, device):
+        return self
+
+
+class FakeTokenizer:
+    # one token per word, ids are the words themselves
+    model_max_length = 8
+
+    def __init__(self):
+        self.decode_kwargs = []
+
+    def __call__(self, texts, add_special_tokens=True):
+        if isinstance(texts, str):
+            return {'input_ids': texts.split()}
+        return {'input_ids': [i.split() for i in texts]}
+
+    def num_special_tokens_to_add(self):
+        return 2
+
+    def build_inputs_with_special_tokens(self, ids):
+        return ['<s>'] + list(ids) + ['</s>']
+
+    def pad(self, features, return_tensors=None):
+        return {'input_ids': Tensor(features['input_ids'])}
+
+    def batch_decode(self, output, **kwargs):
+        self.decode_kwargs.append(kwargs)
+        return [' '.join(i for i in ids if not i.startswith('<')) for ids in output]
+
+
+class FakeModel:
+    def __init__(self, prefix=None):
+        self.config = types.SimpleNamespace(prefix=prefix, max_position_embeddings=8)
+
+    def generate(self, input_ids):
+        # "summary": the last word of the input, with the first one when it is the prefix
+        return [[i[1], i[-2]] if i[1] == 'summarize:' else [i[-2]] for i in input_ids]
+
+
+@pytest.fixture(autouse=True)
+def torch(monkeypatch):
+    module = types.ModuleType('torch')
+    module.no_grad = contextlib.nullcontext
+    monkeypatch.setitem(sys.modules, 'torch', module)
+
+
+def summarizer(prefix=None):
+    model = types.SimpleNamespace(tokenizer=FakeTokenizer(), model=FakeModel(prefix), device='cpu')
+    return TranscriptSummarization(pd.DataFrame({'speaker': [], 'utterance': []}), summary_model=model)
+
+
+def test_decoded_as_the_pipeline():
+    summary = summarizer()
+    assert summary._summarize(['a b c']) == ['c']
+    assert summary._summary_model.tokenizer.decode_kwargs == [
+        dict(skip_special_tokens=True, clean_up_tokenization_spaces=False)]
+
+
+def test_prefix_is_prepended(monkeypatch):
+    summary = summarizer('summarize: ')
+    chunks = []
+    generate = summary._generate
+    monkeypatch.setattr(summary, '_generate', lambda c, *args: chunks.extend(c) or generate(c, *args))
+
+    assert summary._summarize(['a b c']) == ['summarize: c']
+    assert chunks == [['summarize:', 'a', 'b', 'c']]
+
+    # every chunk of a text longer than the model input starts with the prefix
+    chunks.clear()
+    summary._summarize([' '.join('w{}'.format(i) for i in range(12))])
+    assert all(i[0] == 'summarize:' and len(i) <= 6 for i in chunks[:3])
+    assert [j for i in chunks[:3] for j in i if j != 'summarize:'] == ['w{}'.format(i) for i in range(12)]
+
+
+def test_long_text_without_prefix(monkeypatch):
+    summary = summarizer()
+    chunks = []
+    generate = summary._generate
+    monkeypatch.setattr(summary, '_generate', lambda c, *args: chunks.extend(c) or generate(c, *args))
+    summary._summarize([' '.join('w{}'.format(i) for i in range(13))])
+    assert chunks[:3] == [['w0', 'w1', 'w2', 'w3', 'w4', 'w5'], ['w6', 'w7', 'w8', 'w9', 'w10', 'w11'], ['w12']]
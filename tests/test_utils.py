@@ -0,0 +1,194 @@
+import json
+import logging
+import pathlib
+import sys
+import types
+import numpy as np
+import pytest
+import importlib
+from pyconverse import set_inference_backend
+from pyconverse.utils import OnnxSentenceEncoder, _sentence_transformer_config
+
+utils = importlib.import_module('pyconverse.utils')
+
+
+def write_json(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data))
+
+
+def test_config_from_local_model(tmp_path):
+    model = tmp_path / 'model'
+    write_json(model / 'sentence_bert_config.json', {'max_seq_length': 128})
+    write_json(model / 'modules.json', [{'type': 'sentence_transformers.models.Transformer', 'path': ''},
+                                        {'type': 'sentence_transformers.models.Pooling', 'path': '1_Pooling'}])
+    write_json(model / '1_Pooling' / 'config.json', {'pooling_mode_cls_token': True,
+                                                     'pooling_mode_mean_tokens': False})
+
+    export = tmp_path / 'export'
+    config = _sentence_transformer_config(str(model), str(export))
+    assert config == dict(max_seq_length=128, normalize=False, pooling='cls')
+    # the files are kept with the export and read from there afterwards
+    assert (export / '1_Pooling' / 'config.json').exists()
+    assert _sentence_transformer_config(str(tmp_path / 'missing'), str(export)) == config
+
+
+class EntryNotFoundError(Exception):
+    pass
+
+
+@pytest.fixture
+def hub(monkeypatch, tmp_path):
+    files = {}
+
+    def hf_hub_download(model_name, file_name):
+        if file_name not in files:
+            raise EntryNotFoundError(file_name)
+        path = tmp_path / 'hub' / file_name
+        write_json(path, files[file_name])
+        return str(path)
+
+    module = types.ModuleType('huggingface_hub')
+    module.hf_hub_download = hf_hub_download
+    utils = types.ModuleType('huggingface_hub.utils')
+    utils.EntryNotFoundError = EntryNotFoundError
+    module.utils = utils
+    monkeypatch.setitem(sys.modules, 'huggingface_hub', module)
+    monkeypatch.setitem(sys.modules, 'huggingface_hub.utils', utils)
+    return files
+
+
+def test_missing_files_fall_back_with_warning(hub, tmp_path, caplog):
+    with caplog.at_level(logging.WARNING, logger='pyconverse.utils'):
+        config = _sentence_transformer_config('org/model', str(tmp_path / 'export'))
+    assert config == dict(max_seq_length=256, normalize=True, pooling='mean')
+    assert 'sentence_bert_config.json' in caplog.text and 'modules.json' in caplog.text
+
+
+def test_hub_errors_are_not_hidden(hub, tmp_path):
+    def hf_hub_download(model_name, file_name):
+        raise OSError('connection refused')
+
+    sys.modules['huggingface_hub'].hf_hub_download = hf_hub_download
+    with pytest.raises(OSError):
+        _sentence_transformer_config('org/model', str(tmp_path / 'export'))
+
+
+def test_config_from_hub(hub, tmp_path):
+    hub['sentence_bert_config.json'] = {'max_seq_length': 512}
+    hub['modules.json'] = [{'type': 'sentence_transformers.models.Pooling', 'path': '1_Pooling'},
+                           {'type': 'sentence_transformers.models.Normalize', 'path': '2_Normalize'}]
+    hub['1_Pooling/config.json'] = {'pooling_mode_max_tokens': True}
+    config = _sentence_transformer_config('org/model', str(tmp_path / 'export'))
+    assert config == dict(max_seq_length=512, normalize=True, pooling='max')
+
+
+class FakeTokenizer:
+    def __call__(self, sentences, **kwargs):
+        return dict(attention_mask=np.array([[1, 1, 0]] * len(sentences)))
+
+
+class FakeModel:
+    hidden = np.array([[1.0, 4.0], [3.0, 0.0], [100.0, 100.0]])
+
+    def __call__(self, attention_mask):
+        return types.SimpleNamespace(last_hidden_state=np.repeat(self.hidden[None], len(attention_mask), 0))
+
+
+@pytest.mark.parametrize('pooling,expected', [('mean', [2.0, 2.0]), ('cls', [1.0, 4.0]), ('max', [3.0, 4.0])])
+def test_encoder_pooling(pooling, expected):
+    encoder = OnnxSentenceEncoder(FakeTokenizer(), FakeModel(), normalize=False, pooling=pooling)
+    assert encoder.encode(['a', 'b']).tolist() == [expected, expected]
+
+
+def test_encoder_rejects_unknown_pooling():
+    with pytest.raises(ValueError):
+        OnnxSentenceEncoder(FakeTokenizer(), FakeModel(), pooling='weighted')
+
+
+class FakeORTModel:
+    exports = []
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+    @classmethod
+    def from_pretrained(cls, name, export=False, **kwargs):
+        if export:
+            cls.exports.append(name)
+        return cls(name=name, **kwargs)
+
+    def save_pretrained(self, directory):
+        write_json(pathlib.Path(directory) / 'config.json', {})
+        (pathlib.Path(directory) / 'model.onnx').write_bytes(b'onnx')
+
+
+class FakeAutoTokenizer:
+    @classmethod
+    def from_pretrained(cls, name):
+        return cls()
+
+    def save_pretrained(self, directory):
+        pass
+
+
+class SessionOptions:
+    intra_op_num_threads = 0
+
+
+@pytest.fixture
+def onnx(monkeypatch, tmp_path):
+    quantized = []
+
+    def quantize_dynamic(source, output, weight_type):
+        quantized.append(output)
+        open(output, 'wb').close()
+
+    modules = dict(transformers=dict(AutoTokenizer=FakeAutoTokenizer),
+                   onnxruntime=dict(SessionOptions=SessionOptions),
+                   **{'onnxruntime.quantization': dict(quantize_dynamic=quantize_dynamic,
+                                                       QuantType=types.SimpleNamespace(QInt8='int8'))},
+                   optimum={},
+                   **{'optimum.onnxruntime': dict(ORTModelForFeatureExtraction=FakeORTModel)})
+    for name, attributes in modules.items():
+        module = types.ModuleType(name)
+        module.__dict__.update(attributes)
+        monkeypatch.setitem(sys.modules, name, module)
+    sys.modules['onnxruntime'].quantization = sys.modules['onnxruntime.quantization']
+    sys.modules['optimum'].onnxruntime = sys.modules['optimum.onnxruntime']
+
+    versions = dict(transformers=(4, 30), optimum=(1, 12))
+    monkeypatch.setattr(utils, '_package_version', lambda name: versions[name])
+    for key in ('backend', 'quantize', 'threads', 'cache_dir'):
+        monkeypatch.setitem(utils._inference_options, key, utils._inference_options[key])
+    utils._inference_options['cache_dir'] = str(tmp_path / 'onnx')
+    FakeORTModel.exports = []
+    return types.SimpleNamespace(quantized=quantized, versions=versions)
+
+
+@pytest.mark.parametrize('quantize,file_name', [(True, 'model_int8.onnx'), (False, 'model.onnx')])
+def test_export_once_and_load(onnx, quantize, file_name):
+    set_inference_backend('onnx', quantize=quantize, threads=2)
+    for _ in range(2):
+        directory, model = utils._load_onnx(FakeORTModel, 'org/model', file_name='model')
+    assert FakeORTModel.exports == ['org/model']
+    assert directory.endswith('org__model')
+    assert len(onnx.quantized) == quantize
+    assert model.kwargs['name'] == directory
+    assert model.kwargs['file_name'] == file_name
+    assert model.kwargs['session_options'].intra_op_num_threads == 2
+
+
+def test_onnx_sentence_encoder(onnx, hub):
+    set_inference_backend('onnx', quantize=False)
+    encoder = utils._onnx_sentence_encoder('all-MiniLM-L6-v2')
+    assert FakeORTModel.exports == ['sentence-transformers/all-MiniLM-L6-v2']
+    assert isinstance(encoder, OnnxSentenceEncoder) and encoder.pooling == 'mean'
+
+
+@pytest.mark.parametrize('name,version', [('transformers', (4, 11)), ('optimum', (1, 14))])
+def test_unsupported_versions(onnx, name, version):
+    onnx.versions[name] = version
+    with pytest.raises(ImportError, match=name):
+        set_inference_backend('onnx')
+    assert utils._inference_options['backend'] == 'torch'
@@ -0,0 +1,48 @@
+import sys
+import types
+import pytest
+from pyconverse.hypernym_index import default_hypernym_index
+from pyconverse.zeroshot_topic_model import ZeroShotTopicFinder
+
+
+class FakeKeyBERT:
+
+    def __init__(self, model=None, output=None):
+        self.output = output
+        self.calls = []
+
+    def extract_keywords(self, docs):
+        self.calls.append(docs)
+        return self.output
+
+
+@pytest.fixture
+def finder(monkeypatch):
+    keybert = types.ModuleType('keybert')
+    keybert.KeyBERT = FakeKeyBERT
+    monkeypatch.setitem(sys.modules, 'keybert', keybert)
+    monkeypatch.setattr(default_hypernym_index, 'auto_build', False)
+    return ZeroShotTopicFinder(model=object())
+
+
+def test_keywords_one_list_per_document(finder):
+    # keybert 0.5.0 shape, also for a single document
+    finder.model.output = [[('refund', 0.6), ('money', 0.2)]]
+    assert finder.get_keywords(['i want a refund']) == [['refund']]
+    assert finder.get_keyword('i want a refund') == ['refund']
+
+
+def test_keywords_flat_single_document(finder):
+    finder.model.output = [('refund', 0.6), ('money', 0.2)]
+    assert finder.get_keywords(['i want a refund']) == [['refund']]
+
+
+def test_keywords_several_documents(finder):
+    finder.model.output = [[('refund', 0.6)], "None Found", [], [('payment', 0.31), 'junk']]
+    texts = ['i want a refund', '', 'ok', 'payment failed']
+    assert finder.get_keywords(texts) == [['refund'], [], [], ['payment']]
+    assert finder.model.calls == [texts]
+
+
+def test_keywords_no_documents(finder):
+    assert finder.get_keywords([]) == []